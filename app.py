@@ -1,67 +1,321 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
-from models import db, Patient, AuditLog
-from risk_engine import calculate_risk
+from flask import Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, flash, stream_with_context
+from sqlalchemy.engine import make_url
+from models import db, Patient, AuditLog, RiskLabelStat, configure_sqlite
+from risk_engine import calculate_risk, SCORING_FIELDS, REQUIRED_VITALS, VALID_CONDITIONS, VALID_LABS, RULESET_VERSION
 from service_pdf import extract_data_from_pdf
+from migrations import backfill_admission_dates, upgrade_schema
+from rescore import RescoreJob, rescore_stale, stale_count
+from pdf_jobs import PDFJobQueue, QueueFullError
+from pdf_cache import PDFCache, spool_upload, cache_key
+from stats import record_admission, record_label_change, rebuild_stats, dashboard_stats, bump_data_version, data_version
+from cohorts import index_terms, rebuild_cohorts, needs_rebuild, with_condition, with_lab, cohort_counts
+from bulk_patients import FORMATS, detect_format, import_patients, export_patients
+from instrumentation import Instrumentation, phase
+from query_log import QueryLog
+from response_cache import ResponseCache
+from live_feed import LiveFeed
+import io
 import os
 import json
+import shutil
+import uuid
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI', 'sqlite:///risk_system.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.secret_key = 'amrita_health_secret'
+# Services shared by the views; create_app() configures them from app.config
+pdf_cache = PDFCache()
+# Background PDF extraction (used by /upload_pdf?async=1); results are cached when a job finishes
+pdf_jobs = PDFJobQueue(on_result=pdf_cache.put)
+rescore_job = RescoreJob()
+instrumentation = Instrumentation()
+query_log = QueryLog()
+response_cache = ResponseCache()
+live_feed = LiveFeed()
 
-# Ensure upload directory exists
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+main = Blueprint('main', __name__, cli_group=None)
 
-db.init_app(app)
 
-# Helper to Initialize DB
-with app.app_context():
-    db.create_all()
+def load_config(app):
+    """Reads the settings from the environment."""
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI', 'sqlite:///risk_system.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # How long (ms) a SQLite writer waits for a concurrent write to finish
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 10000))
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['PATIENTS_PER_PAGE'] = int(os.environ.get('PATIENTS_PER_PAGE', 50))
+    app.config['AUDIT_LOGS_PER_PAGE'] = int(os.environ.get('AUDIT_LOGS_PER_PAGE', 20))
+    app.config['PDF_WORKERS'] = int(os.environ.get('PDF_WORKERS', 2))
+    app.config['PDF_QUEUE_DEPTH'] = int(os.environ.get('PDF_QUEUE_DEPTH', 32))
+    app.config['PDF_JOB_TIMEOUT'] = int(os.environ.get('PDF_JOB_TIMEOUT', 60))
+    # Pages read per uploaded PDF (0 = no limit)
+    app.config['PDF_MAX_PAGES'] = int(os.environ.get('PDF_MAX_PAGES', 0))
+    # Uploads up to this size are parsed from memory; larger ones spill to a temp file
+    app.config['PDF_SPOOL_MAX_MEMORY'] = int(os.environ.get('PDF_SPOOL_MAX_MEMORY', 8 * 1024 * 1024))
+    app.config['PDF_CACHE_MAX_ENTRIES'] = int(os.environ.get('PDF_CACHE_MAX_ENTRIES', 1000))
+    app.config['PDF_CACHE_MAX_AGE'] = int(os.environ.get('PDF_CACHE_MAX_AGE', 7 * 24 * 3600))
+    # Seconds before a cache hit writes the entry's last-used time again
+    app.config['PDF_CACHE_TOUCH_INTERVAL'] = int(os.environ.get('PDF_CACHE_TOUCH_INTERVAL', 300))
+    # Patients scored and inserted per transaction by the bulk import API
+    app.config['BULK_CHUNK_SIZE'] = int(os.environ.get('BULK_CHUNK_SIZE', 1000))
+    # Row errors listed in a bulk import response (all are counted)
+    app.config['BULK_MAX_REPORTED_ERRORS'] = int(os.environ.get('BULK_MAX_REPORTED_ERRORS', 100))
+    # Background re-scoring of patients scored under an older RULESET_VERSION
+    app.config['RESCORE_ON_STARTUP'] = os.environ.get('RESCORE_ON_STARTUP', '1') == '1'
+    app.config['RESCORE_CHUNK_SIZE'] = int(os.environ.get('RESCORE_CHUNK_SIZE', 500))
+    # Seconds the job sleeps between chunks, leaving the database to live requests
+    app.config['RESCORE_PAUSE'] = float(os.environ.get('RESCORE_PAUSE', 0.1))
+    # Per-request phase timings (Server-Timing header and /metrics); off by default
+    app.config['INSTRUMENTATION'] = os.environ.get('INSTRUMENTATION', '0') == '1'
+    # SQL statements slower than SLOW_QUERY_MS are logged, and statements repeated
+    # N_PLUS_ONE_THRESHOLD times in one request are reported as N+1; off by default
+    app.config['QUERY_LOG'] = os.environ.get('QUERY_LOG', '0') == '1'
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+    # Rendered dashboard / patient pages, invalidated by every patient write (0 = no caching)
+    app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 30))
+    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 256))
+    # Live dashboard feed: keep-alive interval and how often events published by
+    # other processes are looked for (seconds)
+    app.config['LIVE_FEED_HEARTBEAT'] = float(os.environ.get('LIVE_FEED_HEARTBEAT', 15))
+    app.config['LIVE_FEED_POLL_INTERVAL'] = float(os.environ.get('LIVE_FEED_POLL_INTERVAL', 1))
+    # Each open feed holds a request thread: streams served per process (0 = no
+    # limit) and the seconds a client turned away waits before reconnecting
+    app.config['LIVE_FEED_MAX_STREAMS'] = int(os.environ.get('LIVE_FEED_MAX_STREAMS', 0))
+    app.config['LIVE_FEED_BUSY_RETRY'] = float(os.environ.get('LIVE_FEED_BUSY_RETRY', 30))
+    # Connection pool of each worker process; give it at least one connection
+    # per request thread (WEB_THREADS)
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+    # Seconds after which a connection to a database server is replaced
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.secret_key = 'amrita_health_secret'
+
+
+def engine_options(config):
+    """
+    SQLAlchemy pool settings for a multi-threaded worker process.
+
+    SQLite files get a pool of DB_POOL_SIZE connections shared by the request
+    threads (WAL lets them read concurrently; writers queue on the busy
+    timeout). Database servers additionally get overflow connections,
+    pre-ping and recycling. In-memory SQLite keeps Flask-SQLAlchemy's
+    single shared connection.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            return {}
+        return {'pool_size': config['DB_POOL_SIZE'], 'max_overflow': 0, 'pool_timeout': 30}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def configure_services(config):
+    pdf_jobs.max_workers = config['PDF_WORKERS']
+    pdf_jobs.max_queue = config['PDF_QUEUE_DEPTH']
+    pdf_jobs.timeout = config['PDF_JOB_TIMEOUT']
+    pdf_jobs.max_pages = config['PDF_MAX_PAGES'] or None
+    pdf_cache.max_entries = config['PDF_CACHE_MAX_ENTRIES']
+    pdf_cache.max_age = config['PDF_CACHE_MAX_AGE']
+    pdf_cache.touch_interval = config['PDF_CACHE_TOUCH_INTERVAL']
+    rescore_job.chunk_size = config['RESCORE_CHUNK_SIZE']
+    rescore_job.pause = config['RESCORE_PAUSE']
+    query_log.slow_ms = config['SLOW_QUERY_MS']
+    query_log.repeat_threshold = config['N_PLUS_ONE_THRESHOLD']
+    response_cache.max_entries = config['RESPONSE_CACHE_MAX_ENTRIES']
+    response_cache.ttl = config['RESPONSE_CACHE_TTL']
+    live_feed.heartbeat = config['LIVE_FEED_HEARTBEAT']
+    live_feed.poll_interval = config['LIVE_FEED_POLL_INTERVAL']
+    live_feed.max_streams = config['LIVE_FEED_MAX_STREAMS']
+    live_feed.busy_retry = config['LIVE_FEED_BUSY_RETRY']
+
+
+def init_database(app):
+    """Startup maintenance; cheap (read-only) when the database is up to date."""
+    with app.app_context():
+        configure_sqlite(db.engine, app.config['SQLITE_BUSY_TIMEOUT'])
+        # Creates missing tables, columns and indexes; no DDL when there are none
+        upgrade_schema()
+        # The patient list pages by admission date; rows imported without one get one
+        backfilled = backfill_admission_dates()
+        # Backfill the dashboard counters for databases created before they existed
+        # (or recount the backfilled days)
+        if backfilled or (RiskLabelStat.query.first() is None and Patient.query.first() is not None):
+            rebuild_stats()
+        # Backfill the condition/lab tables the cohort filters query
+        if needs_rebuild():
+            rebuild_cohorts()
+        # Stored risks predating the current ruleset are re-scored in the background
+        if app.config['RESCORE_ON_STARTUP'] and stale_count():
+            rescore_job.start(app)
+        db.session.remove()
+
+
+def create_app(config=None):
+    """
+    Application factory.
+
+    Args:
+        config (dict, optional): Settings overriding those from the environment.
+    """
+    app = Flask(__name__)
+    load_config(app)
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+
+    # Ensure upload directory exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    db.init_app(app)
+    configure_services(app.config)
+    instrumentation.init_app(app)
+    if app.config['INSTRUMENTATION']:
+        instrumentation.enable()
+    query_log.init_app(app)
+    if app.config['QUERY_LOG']:
+        query_log.enable()
+    app.register_blueprint(main)
+
+    init_database(app)
+    return app
+
+
+def __getattr__(name):
+    # The default application (flask --app app, the benchmarks,
+    # tests) is built on first use, so importing this module has no side effects
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 from datetime import datetime, timedelta
 
-@app.route('/')
+@main.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Create any tables, columns and indexes missing from an existing database."""
+    created = upgrade_schema()
+    print(f"Created: {', '.join(created) if created else 'nothing (already up to date)'}")
+
+@main.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the dashboard counter tables from the Patient table."""
+    total = rebuild_stats()
+    print(f"Rebuilt dashboard statistics for {total} patients.")
+
+@main.cli.command('rebuild-cohorts')
+def rebuild_cohorts_command():
+    """Recompute the condition/lab tables from the Patient history and lab columns."""
+    total = rebuild_cohorts()
+    print(f"Indexed conditions and labs for {total} patients.")
+
+@main.cli.command('rescore')
+def rescore_command():
+    """Re-score, in the foreground, all patients scored under an older ruleset."""
+    rescore_job.stop()
+    progress = rescore_stale(chunk_size=current_app.config['RESCORE_CHUNK_SIZE'], pause=0)
+    print(f"Re-scored {progress['rescored']} patients under ruleset v{RULESET_VERSION}; "
+          f"{progress['label_changes']} changed risk label.")
+
+@main.route('/')
+@response_cache.cached
 def dashboard():
-    patients = Patient.query.all()
-    
     # 1. Recent Admissions (Last 5)
     recent_patients = Patient.query.order_by(Patient.admission_date.desc()).limit(5).all()
 
-    # 2. Risk Distribution (Donut Chart)
-    risk_counts = {'HIGH': 0, 'MEDIUM': 0, 'LOW': 0}
-    for p in patients:
-        if p.risk_label in risk_counts:
-            risk_counts[p.risk_label] += 1
-            
-    # 3. 7-Day Risk Trend (Line Chart) - Count of High Risk patients admitted per day
-    today = datetime.utcnow().date()
-    dates = [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
-    trend_data = []
-    
-    for date_str in dates:
-        count = 0
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        for p in patients:
-            if p.admission_date.date() == target_date and p.risk_label == 'HIGH':
-                count += 1
-        trend_data.append(count)
+    # 2. Risk Distribution and 3. 7-Day High Risk Trend, read from the
+    # incrementally maintained counter tables (see stats.py)
+    stats = dashboard_stats()
 
     return render_template('dashboard.html', 
-                           patients=patients, 
                            recent_patients=recent_patients,
-                           risk_counts=risk_counts,
-                           trend_dates=dates,
-                           trend_data=trend_data)
+                           # The live feed resumes from the state this page shows
+                           live_after=live_feed.latest_id(),
+                           **stats)
 
-@app.route('/patients')
+@main.route('/patients')
+@response_cache.cached
 def patient_list():
-    patients = Patient.query.order_by(Patient.admission_date.desc()).all()
-    return render_template('patient_list.html', patients=patients)
+    # Filters (all optional) are applied in SQL and carried through the page links
+    filters = {
+        'risk': request.args.get('risk', '').upper(),
+        'q': request.args.get('q', '').strip(),
+        'from': request.args.get('from', ''),
+        'to': request.args.get('to', ''),
+        'condition': request.args.get('condition', '').strip(),
+        'lab': request.args.get('lab', '').strip(),
+    }
+    query = Patient.query
+
+    if filters['risk'] in ('HIGH', 'MEDIUM', 'LOW'):
+        query = query.filter(Patient.risk_label == filters['risk'])
+    else:
+        filters['risk'] = ''
+
+    if filters['q']:
+        prefix = filters['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(Patient.name.like(prefix + '%', escape='\\'))
+
+    date_from = parse_date(filters['from'])
+    if date_from:
+        query = query.filter(Patient.admission_date >= date_from)
+    date_to = parse_date(filters['to'])
+    if date_to:
+        query = query.filter(Patient.admission_date < date_to + timedelta(days=1))
+
+    # Cohorts come from the indexed PatientCondition / PatientLab tables
+    if filters['condition']:
+        query = with_condition(query, filters['condition'])
+    if filters['lab']:
+        query = with_lab(query, filters['lab'])
 
-@app.route('/add', methods=['GET', 'POST'])
+    # Keyset pagination on (admission_date, id), newest first
+    cursor = parse_cursor(request.args.get('cursor', ''))
+    if cursor:
+        cursor_date, cursor_id = cursor
+        query = query.filter(db.or_(
+            Patient.admission_date < cursor_date,
+            db.and_(Patient.admission_date == cursor_date, Patient.id < cursor_id)
+        ))
+
+    per_page = current_app.config['PATIENTS_PER_PAGE']
+    patients = query.order_by(Patient.admission_date.desc(), Patient.id.desc()) \
+        .limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(patients) > per_page:
+        patients = patients[:per_page]
+        last = patients[-1]
+        next_cursor = f"{last.admission_date.isoformat()}_{last.id}"
+
+    active_filters = {k: v for k, v in filters.items() if v}
+    return render_template('patient_list.html',
+                           patients=patients,
+                           filters=filters,
+                           active_filters=active_filters,
+                           is_first_page=cursor is None,
+                           next_cursor=next_cursor,
+                           condition_options=VALID_CONDITIONS,
+                           lab_options=VALID_LABS)
+
+def parse_date(value):
+    """Parses a YYYY-MM-DD query parameter, returning None when absent or invalid."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+def parse_cursor(value):
+    """Decodes an '<admission_date iso>_<id>' page cursor into a (datetime, id) tuple."""
+    try:
+        date_part, id_part = value.rsplit('_', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        return None
+
+@main.route('/add', methods=['GET', 'POST'])
 def add_patient():
     if request.method == 'POST':
         # 1. Extract Data
@@ -80,11 +334,13 @@ def add_patient():
         }
 
         # 2. Calculate Initial Risk (Automatic)
-        risk_result = calculate_risk(data)
+        with phase('risk'):
+            risk_result = calculate_risk(data)
 
         # 3. Create Patient Record
         new_patient = Patient(
             name=request.form['name'],
+            admission_date=datetime.utcnow(),
             age=data['age'],
             gender=request.form['gender'],
             heart_rate=data['heart_rate'],
@@ -100,12 +356,13 @@ def add_patient():
             # System Assigned Risk
             risk_score=risk_result['score'],
             risk_label=risk_result['label'],
-            risk_notes=json.dumps(risk_result['notes'])
+            risk_notes=json.dumps(risk_result['notes']),
+            rule_version=RULESET_VERSION
         )
 
         db.session.add(new_patient)
-        db.session.commit()
-        
+        db.session.flush() # Generate ID; everything below commits together
+
         # Log Creation
         log = AuditLog(
             patient_id=new_patient.id,
@@ -115,13 +372,26 @@ def add_patient():
             risk_change=f"Started as {risk_result['label']}"
         )
         db.session.add(log)
+        record_admission(new_patient.admission_date, new_patient.risk_label)
+        index_terms([(new_patient.id, data['history'], data['lab_issues'])])
+        bump_data_version()
+        live_feed.publish('admission', {'patient': {
+            'id': new_patient.id,
+            'name': new_patient.name,
+            'age': new_patient.age,
+            'gender': new_patient.gender,
+            'admission_date': new_patient.admission_date.strftime('%Y-%m-%d %H:%M'),
+            'risk_score': new_patient.risk_score,
+            'risk_label': new_patient.risk_label
+        }}, data_version())
         db.session.commit()
+        live_feed.notify()
 
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     return render_template('add_patient.html')
 
-@app.route('/upload_pdf', methods=['POST'])
+@main.route('/upload_pdf', methods=['POST'])
 def upload_pdf():
     if 'file' not in request.files:
         return json.dumps({'error': 'No file part'}), 400
@@ -131,24 +401,151 @@ def upload_pdf():
         return json.dumps({'error': 'No selected file'}), 400
         
     if file:
-        filename = file.filename
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        try:
-            data = extract_data_from_pdf(filepath)
-            # clean up
-            os.remove(filepath)
-            return json.dumps(data)
-        except Exception as e:
-            return json.dumps({'error': str(e)}), 500
-
-@app.route('/update/<int:id>', methods=['POST'])
+        max_pages = current_app.config['PDF_MAX_PAGES'] or None
+        async_mode = request.args.get('async') == '1'
+
+        # Read the upload into memory (spilling to a temp file only when large),
+        # hashing it on the way, then reuse an earlier result for identical uploads
+        upload = spool_upload(file, current_app.config['PDF_SPOOL_MAX_MEMORY'])
+        with upload.file:
+            key = cache_key(upload.digest, max_pages)
+            cached = pdf_cache.get(key)
+            if cached is not None:
+                if async_mode:
+                    return json.dumps({'status': 'done', 'result': cached, 'cached': True})
+                return json.dumps(cached)
+
+            # Job mode: hand the document to the worker pool and return a job id immediately
+            if async_mode:
+                if upload.size <= current_app.config['PDF_SPOOL_MAX_MEMORY']:
+                    upload.file.seek(0)
+                    source = upload.file.read()
+                else:
+                    # Too large to pickle to a worker; give it a uniquely named file instead
+                    source = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}.pdf")
+                    upload.file.seek(0)
+                    with open(source, 'wb') as out:
+                        shutil.copyfileobj(upload.file, out)
+                try:
+                    job_id = pdf_jobs.submit(source, key=key)
+                except QueueFullError as e:
+                    if isinstance(source, str):
+                        os.remove(source)
+                    return json.dumps({'error': str(e)}), 503
+                return json.dumps({'job_id': job_id, 'status': 'pending'}), 202
+
+            try:
+                with phase('pdf'):
+                    data = extract_data_from_pdf(upload.file, max_pages=max_pages)
+                # An empty result means the PDF could not be read; don't cache that
+                if data:
+                    pdf_cache.put(key, data)
+                return json.dumps(data)
+            except Exception as e:
+                return json.dumps({'error': str(e)}), 500
+
+@main.route('/upload_pdf/jobs/<job_id>')
+def pdf_job_status(job_id):
+    status = pdf_jobs.job_status(job_id)
+    if status is None:
+        return json.dumps({'error': 'Unknown job'}), 404
+    return json.dumps(status)
+
+@main.route('/upload_pdf/cache')
+def pdf_cache_stats():
+    """Hit/miss counters (for this process) and size of the extraction cache."""
+    return json.dumps(pdf_cache.stats()), 200, {'Content-Type': 'application/json'}
+
+@main.route('/api/rescore')
+def rescore_status():
+    """Progress of the background re-scoring job."""
+    status = dict(rescore_job.status(), stale=stale_count())
+    return json.dumps(status), 200, {'Content-Type': 'application/json'}
+
+@main.route('/metrics')
+def metrics():
+    """Request latency histograms in the Prometheus text format (INSTRUMENTATION=1)."""
+    if not instrumentation.enabled:
+        return json.dumps({'error': 'Instrumentation is disabled'}), 404, {'Content-Type': 'application/json'}
+    return instrumentation.render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@main.route('/api/live')
+def live_events():
+    """Server-sent events with dashboard deltas (admissions, risk changes)."""
+    live_feed.start(current_app._get_current_object())
+    # Catch up with events published by other processes before picking the start id
+    live_feed.poll()
+    # A reconnect sends Last-Event-ID; a first connect the id its page was rendered at
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('after', ''))
+    except ValueError:
+        last_id = None
+    return Response(live_feed.stream(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@main.route('/api/page-cache')
+def page_cache_stats():
+    """Hit/miss counters (for this process) and size of the rendered page cache."""
+    return json.dumps(response_cache.stats()), 200, {'Content-Type': 'application/json'}
+
+@main.route('/api/queries')
+def query_summary():
+    """SQL statements per request, by endpoint (QUERY_LOG=1)."""
+    if not query_log.enabled:
+        return json.dumps({'error': 'Query log is disabled'}), 404, {'Content-Type': 'application/json'}
+    return json.dumps(query_log.summary()), 200, {'Content-Type': 'application/json'}
+
+@main.route('/api/cohorts')
+def cohorts_summary():
+    """Patients per recognised condition / lab term and risk label."""
+    return json.dumps(cohort_counts()), 200, {'Content-Type': 'application/json'}
+
+@main.route('/api/patients/import', methods=['POST'])
+def bulk_import():
+    """
+    Imports patients from a CSV or NDJSON body (or a 'file' upload).
+    ?format=csv|ndjson overrides detection from the file name / Content-Type.
+    """
+    upload = request.files.get('file')
+    if upload:
+        stream, fmt = upload.stream, detect_format(upload.filename, upload.mimetype)
+    else:
+        stream, fmt = request.stream, detect_format(content_type=request.mimetype)
+    fmt = request.args.get('format', fmt)
+    if fmt not in FORMATS:
+        return json.dumps({'error': f"Unsupported format: {fmt}"}), 400
+
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    try:
+        summary = import_patients(text, fmt, chunk_size=current_app.config['BULK_CHUNK_SIZE'],
+                                  max_errors=current_app.config['BULK_MAX_REPORTED_ERRORS'])
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return json.dumps({'error': 'File must be UTF-8 text'}), 400
+    finally:
+        text.detach()
+
+    summary['errors'] = [{'line': line, 'error': error}
+                         for line, error in summary['errors']]
+    return json.dumps(summary), 200, {'Content-Type': 'application/json'}
+
+@main.route('/api/patients/export')
+def bulk_export():
+    """Streams every patient as CSV (default) or NDJSON (?format=ndjson)."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return json.dumps({'error': f"Unsupported format: {fmt}"}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(export_patients(fmt)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=patients.{fmt}'})
+
+@main.route('/update/<int:id>', methods=['POST'])
 def update_patient(id):
     patient = Patient.query.get_or_404(id)
     
     # 1. Capture Old State for Audit
     old_risk = patient.risk_label
+    old_version = patient.rule_version
     changes_made = []
 
     # Helper function to check change and log it
@@ -175,31 +572,42 @@ def update_patient(id):
             else:
                 setattr(patient, field_name, new_val)
 
-    # Check Vitals fields
-    check_change('heart_rate', int(request.form['heart_rate']))
-    check_change('systolic_bp', int(request.form['systolic_bp']))
-    check_change('diastolic_bp', int(request.form['diastolic_bp']))
-    check_change('spo2', int(request.form['spo2']))
-    check_change('temperature', float(request.form['temperature']))
-    check_change('respiratory_rate', int(request.form['respiratory_rate']))
-    check_change('er_visits', int(request.form['er_visits']))
+    # Check Vitals fields (a blank input leaves the vital unrecorded)
+    check_change('heart_rate', form_number('heart_rate', int))
+    check_change('systolic_bp', form_number('systolic_bp', int))
+    check_change('diastolic_bp', form_number('diastolic_bp', int))
+    check_change('spo2', form_number('spo2', int))
+    check_change('temperature', form_number('temperature', float))
+    check_change('respiratory_rate', form_number('respiratory_rate', int))
+    check_change('er_visits', form_number('er_visits', int) or 0)
     # Text notes
     if 'notes' in request.form:
         check_change('notes', request.form['notes'])
 
-    # 2. Recalculate Risk (Automatic)
-    current_data = patient.to_dict()
-    new_risk_result = calculate_risk(current_data)
-    
-    patient.risk_score = new_risk_result['score']
-    patient.risk_label = new_risk_result['label']
-    patient.risk_notes = json.dumps(new_risk_result['notes'])
-
-    # 3. Save to DB and Create Audit Logs 
+    # 2. Recalculate Risk (Automatic), only if an input to the score or the rules changed
     risk_msg = "No Change"
-    if old_risk != new_risk_result['label']:
-        risk_msg = f"{old_risk} -> {new_risk_result['label']}"
+    if patient.rule_version != RULESET_VERSION or \
+            any(change['field'] in SCORING_FIELDS for change in changes_made):
+        # Scoring a missing vital at its default would read as critical
+        missing = [field for field in REQUIRED_VITALS if getattr(patient, field) is None]
+        if missing:
+            db.session.rollback()
+            flash(f"Enter {', '.join(AUDIT_FIELD_LABELS[f] for f in missing)} to recalculate the risk.", 'error')
+            return redirect(url_for('main.patient_details', id=id))
+        current_data = patient.to_dict()
+        with phase('risk'):
+            new_risk_result = calculate_risk(current_data)
+
+        patient.risk_score = new_risk_result['score']
+        patient.risk_label = new_risk_result['label']
+        patient.risk_notes = json.dumps(new_risk_result['notes'])
+        patient.rule_version = RULESET_VERSION
+
+        if old_risk != new_risk_result['label']:
+            risk_msg = f"{old_risk} -> {new_risk_result['label']}"
+            record_label_change(patient.admission_date, old_risk, new_risk_result['label'])
 
+    # 3. Save to DB and Create Audit Logs (one transaction)
     for change in changes_made:
         log = AuditLog(
             patient_id=patient.id,
@@ -209,26 +617,92 @@ def update_patient(id):
             risk_change=risk_msg
         )
         db.session.add(log)
-    
+    if not changes_made and risk_msg != "No Change":
+        # Only the ruleset changed the label; log it as the background re-score would
+        db.session.add(AuditLog(
+            patient_id=patient.id,
+            field_changed='Rule Version',
+            old_value=f"v{old_version or 0}",
+            new_value=f"v{RULESET_VERSION}",
+            risk_change=risk_msg
+        ))
+    changed = changes_made or patient.rule_version != old_version
+    if changed:
+        bump_data_version()
+        live_feed.publish('update', {
+            'id': patient.id,
+            'admission_day': patient.admission_date.strftime('%Y-%m-%d'),
+            'risk_score': patient.risk_score,
+            'old_label': old_risk,
+            'risk_label': patient.risk_label
+        }, data_version())
+
     db.session.commit()
-    return redirect(url_for('dashboard'))
+    if changed:
+        live_feed.notify()
+    return redirect(url_for('main.dashboard'))
+
+def form_number(field, type_func):
+    """A numeric form field, or None when it was left blank."""
+    value = request.form.get(field, '').strip()
+    return type_func(value) if value else None
+
+# Display names for audited fields on the patient timeline
+AUDIT_FIELD_LABELS = {
+    'er_visits': 'ER Visits',
+    'respiratory_rate': 'Respiratory Rate',
+    'heart_rate': 'Heart Rate',
+    'systolic_bp': 'Systolic BP',
+    'diastolic_bp': 'Diastolic BP',
+    'spo2': 'SpO2',
+    'temperature': 'Temperature'
+}
 
-@app.route('/patient/<int:id>')
+def fetch_audit_page(patient_id, cursor=None):
+    """
+    Returns one page of a patient's audit timeline, newest first, plus the
+    cursor for the next (older) page or None when there is nothing older.
+    """
+    query = AuditLog.query.filter(AuditLog.patient_id == patient_id)
+    if cursor:
+        cursor_ts, cursor_id = cursor
+        query = query.filter(db.or_(
+            AuditLog.timestamp < cursor_ts,
+            db.and_(AuditLog.timestamp == cursor_ts, AuditLog.id < cursor_id)
+        ))
+
+    per_page = current_app.config['AUDIT_LOGS_PER_PAGE']
+    logs = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()) \
+        .limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(logs) > per_page:
+        logs = logs[:per_page]
+        next_cursor = f"{logs[-1].timestamp.isoformat()}_{logs[-1].id}"
+    return logs, next_cursor
+
+@main.route('/patient/<int:id>')
+@response_cache.cached
 def patient_details(id):
     patient = Patient.query.get_or_404(id)
-    logs = sorted(patient.logs, key=lambda x: x.timestamp, reverse=True)
-    
-    field_labels = {
-        'er_visits': 'ER Visits',
-        'respiratory_rate': 'Respiratory Rate',
-        'heart_rate': 'Heart Rate',
-        'systolic_bp': 'Systolic BP',
-        'diastolic_bp': 'Diastolic BP',
-        'spo2': 'SpO2',
-        'temperature': 'Temperature'
-    }
+    logs, next_cursor = fetch_audit_page(patient.id)
     
-    return render_template('patient_details.html', patient=patient, logs=logs, field_labels=field_labels)
+    return render_template('patient_details.html', patient=patient, logs=logs,
+                           field_labels=AUDIT_FIELD_LABELS, next_logs_cursor=next_cursor)
+
+@main.route('/patient/<int:id>/logs')
+def patient_logs(id):
+    """JSON endpoint behind the timeline's "Load older" button."""
+    patient = Patient.query.get_or_404(id)
+    cursor = parse_cursor(request.args.get('before', ''))
+    logs, next_cursor = fetch_audit_page(patient.id, cursor)
+
+    entries = []
+    for log in logs:
+        entry = log.to_dict()
+        entry['field_label'] = AUDIT_FIELD_LABELS.get(log.field_changed, log.field_changed or '').title()
+        entries.append(entry)
+    return json.dumps({'logs': entries, 'next_cursor': next_cursor}), 200, {'Content-Type': 'application/json'}
     
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+Benchmark for the hot-query indexes (see migrations.py).
+
+Builds a throwaway SQLite database without the model indexes, times the
+queries behind the dashboard, the filtered patient list and the audit
+timeline, applies upgrade_schema() and times them again. The SQLite query
+plan is printed for each run so the switch from table scans to index
+lookups is visible.
+
+Usage:
+    python benchmarks/bench_indexes.py [num_patients]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, text
+from models import db, Patient, AuditLog
+from migrations import upgrade_schema
+
+QUERIES = {
+    'recent admissions': (
+        "SELECT * FROM patient ORDER BY admission_date DESC LIMIT 5", {}),
+    'high-risk page': (
+        "SELECT * FROM patient WHERE risk_label = :label "
+        "ORDER BY admission_date DESC, id DESC LIMIT 50", {'label': 'HIGH'}),
+    'high-risk trend': (
+        "SELECT date(admission_date), count(id) FROM patient "
+        "WHERE risk_label = :label AND admission_date >= :start GROUP BY date(admission_date)",
+        {'label': 'HIGH', 'start': '2025-01-24 00:00:00'}),
+    'audit timeline': (
+        "SELECT * FROM audit_log WHERE patient_id = :pid "
+        "ORDER BY timestamp DESC LIMIT 20", {'pid': 42}),
+}
+REPEATS = 20
+
+
+def populate(engine, num_patients):
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    patients = []
+    logs = []
+    for i in range(1, num_patients + 1):
+        admitted = start + timedelta(minutes=rng.randint(0, 400 * 24 * 60))
+        patients.append({
+            'id': i, 'name': f"Patient {i}", 'age': rng.randint(18, 95),
+            'admission_date': admitted, 'risk_label': rng.choice(['LOW', 'LOW', 'MEDIUM', 'HIGH']),
+            'risk_score': rng.randint(0, 10),
+        })
+        for j in range(3):
+            logs.append({'patient_id': i, 'timestamp': admitted + timedelta(hours=j),
+                         'field_changed': 'heart_rate', 'old_value': '80', 'new_value': '90',
+                         'risk_change': 'No Change'})
+    with engine.begin() as conn:
+        conn.execute(Patient.__table__.insert(), patients)
+        conn.execute(AuditLog.__table__.insert(), logs)
+
+
+def run_queries(engine, title):
+    print(f"\n== {title} ==")
+    with engine.connect() as conn:
+        for name, (sql, params) in QUERIES.items():
+            plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).fetchall()
+            began = time.perf_counter()
+            for _ in range(REPEATS):
+                conn.execute(text(sql), params).fetchall()
+            elapsed_ms = (time.perf_counter() - began) / REPEATS * 1000
+            print(f"{name:<18} {elapsed_ms:8.3f} ms   plan: {' | '.join(row[-1] for row in plan)}")
+
+
+def main():
+    num_patients = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+
+        # Simulate a database created before the indexes were declared
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.drop(conn)
+
+        print(f"Populating {num_patients} patients and {num_patients * 3} audit rows...")
+        populate(engine, num_patients)
+        run_queries(engine, "before (no indexes)")
+
+        created = upgrade_schema(engine)
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        print(f"\nupgrade_schema() created: {', '.join(created)}")
+        run_queries(engine, "after upgrade_schema()")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
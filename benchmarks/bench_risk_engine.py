@@ -0,0 +1,90 @@
+"""
+Micro-benchmark for the compiled risk rule table (risk_rules.json).
+
+Times per-call latency of calculate_risk() against the hand-coded rules it
+replaced (reference_calculate_risk in tests/test_riskEngine.py) on the same
+synthetic patients, after checking that both return identical results, and
+measures what the notes-free calculate_risk(data, explain=False) saves in
+time and memory allocations.
+
+Usage:
+    python benchmarks/bench_risk_engine.py [num_patients]
+"""
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'tests'))
+
+from risk_engine import calculate_risk
+from test_riskEngine import reference_calculate_risk
+
+CONDITIONS = ['Diabetes', 'COPD', 'Hypertension', 'Migraine', 'Asthma', 'Gout']
+LABS = ['Elevated WBC', 'High CRP', 'Low Sodium']
+
+
+def make_patients(count):
+    rng = random.Random(11)
+    return [{
+        'age': rng.randint(18, 95),
+        'heart_rate': rng.randint(45, 160),
+        'systolic_bp': rng.randint(70, 190),
+        'spo2': rng.randint(80, 100),
+        'temperature': round(rng.uniform(35.5, 40.5), 1),
+        'respiratory_rate': rng.randint(10, 32),
+        'er_visits': rng.randint(0, 5),
+        'history': rng.sample(CONDITIONS, rng.randint(0, 3)),
+        'lab_issues': rng.sample(LABS, rng.randint(0, 2)),
+    } for _ in range(count)]
+
+
+def per_call_us(func, patients, repeat=5):
+    def run():
+        for data in patients:
+            func(data)
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return best / len(patients) * 1e6
+
+
+def allocations(func, patients):
+    """Bytes allocated per call and the peak while scoring every patient."""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    results = [func(data) for data in patients]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return (current - before) / len(patients), peak - before
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    patients = make_patients(count)
+    for data in patients:
+        assert calculate_risk(data) == reference_calculate_risk(data)
+
+    reference_us = per_call_us(reference_calculate_risk, patients)
+    compiled_us = per_call_us(calculate_risk, patients)
+    print(f"{count} patients, best of 5 runs (per call):")
+    print(f"  hand-coded rules     : {reference_us:6.2f} us")
+    print(f"  compiled rule table  : {compiled_us:6.2f} us  ({reference_us / compiled_us:.2f}x)")
+
+    fast = lambda data: calculate_risk(data, explain=False)
+    fast_us = per_call_us(fast, patients)
+    print(f"  explain=False        : {fast_us:6.2f} us  ({compiled_us / fast_us:.2f}x vs explain=True)")
+
+    # Results are kept alive, so this is what each retained result costs
+    full_bytes, full_peak = allocations(calculate_risk, patients)
+    fast_bytes, fast_peak = allocations(fast, patients)
+    print("\nMemory held by the results (tracemalloc):")
+    print(f"  explain=True         : {full_bytes:7.0f} B/result, peak {full_peak / 1e6:6.1f} MB")
+    print(f"  explain=False        : {fast_bytes:7.0f} B/result, peak {fast_peak / 1e6:6.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
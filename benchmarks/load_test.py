@@ -0,0 +1,159 @@
+"""
+Load test of the production server: requests per second vs gunicorn workers.
+
+Seeds a throwaway SQLite database, then for every worker count starts
+`gunicorn -c gunicorn.conf.py wsgi:application` on it and drives it with
+--concurrency client processes (keep-alive connections) for --duration
+seconds, cycling through the dashboard, the patient list and random
+patient detail pages.
+
+The rendered page cache is disabled unless --cache is given, so every
+request queries and renders. Throughput can only scale with workers up to
+the number of CPU cores (clients included).
+
+Usage:
+    python benchmarks/load_test.py [--workers 1,2,4] [--threads 8] [--concurrency 16]
+                                   [--duration 10] [--patients 10000] [--cache] [-o results.json]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+
+def seed(database_uri, patients):
+    from app import create_app
+    from bulk_patients import insert_chunk
+    from models import db
+    from run_benchmarks import census
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri, 'RESCORE_ON_STARTUP': False})
+    rng = random.Random(1234)
+    with app.app_context():
+        for start in range(0, patients, 5000):
+            insert_chunk(list(census(rng, min(5000, patients - start))))
+        db.engine.dispose()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/rescore')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def client(args):
+    """One keep-alive connection issuing requests until the deadline."""
+    port, deadline, patients, seed_value = args
+    rng = random.Random(seed_value)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        path = rng.choice(['/', '/patients', f"/patient/{rng.randint(1, patients)}"])
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return latencies, errors
+
+
+def run_level(database_uri, workers, threads, concurrency, duration, patients, cache):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URI=database_uri, WEB_BIND=f"127.0.0.1:{port}",
+               WEB_WORKERS=str(workers), WEB_THREADS=str(threads), RESCORE_ON_STARTUP='0')
+    if not cache:
+        env['RESPONSE_CACHE_TTL'] = '0'
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(port)
+        deadline = time.time() + duration
+        with multiprocessing.Pool(concurrency) as pool:
+            results = pool.map(client, [(port, deadline, patients, i) for i in range(concurrency)])
+    finally:
+        server.terminate()
+        server.wait(30)
+
+    latencies = sorted(l for result, _ in results for l in result)
+    errors = sum(e for _, e in results)
+    if not latencies:
+        return {'workers': workers, 'requests': 0, 'errors': errors, 'rps': 0.0}
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / duration, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Requests per second of the gunicorn server per worker count.")
+    parser.add_argument('--workers', default='1,2,4', help="Comma-separated worker counts (default: 1,2,4)")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per worker (default: 8)")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent client connections (default: 16)")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per worker count (default: 10)")
+    parser.add_argument('--patients', type=int, default=10000, help="Patients in the test database")
+    parser.add_argument('--cache', action='store_true', help="Keep the rendered page cache enabled")
+    parser.add_argument('-o', '--output', help="Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_uri = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        print(f"Seeding {args.patients} patients...")
+        seed(database_uri, args.patients)
+
+        print(f"{'workers':>8} {'req/s':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+        results = []
+        for workers in (int(w) for w in args.workers.split(',') if w.strip()):
+            level = run_level(database_uri, workers, args.threads, args.concurrency,
+                              args.duration, args.patients, args.cache)
+            results.append(level)
+            print(f"{workers:>8} {level['rps']:>9} {level.get('mean_ms', '-'):>9} "
+                  f"{level.get('p50_ms', '-'):>9} {level.get('p95_ms', '-'):>9} {level['errors']:>7}")
+
+    print(f"({os.cpu_count()} CPU cores)")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'threads': args.threads,
+                       'concurrency': args.concurrency, 'cache': args.cache, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Benchmark suite: risk engine, PDF extraction and HTTP routes.
+
+Builds a throwaway SQLite census that grows through the requested sizes
+(default 1k, 10k and 100k patients), and at each size times:
+  * calculate_risk() per call (with and without notes) and calculate_risk_batch();
+  * the '/', '/patients' and '/patient/<id>' routes through the Flask test client.
+extract_data_from_pdf() is timed once on a reportlab-generated corpus.
+
+Results are written as JSON. Pass --baseline with an earlier results file
+to print the change of every metric; with --max-regression the run fails
+if any timing got slower by more than that factor.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 1000,10000,100000] [-o results.json]
+                                        [--baseline old.json [--max-regression 1.25]]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+CONDITIONS = ['Diabetes', 'COPD', 'Hypertension', 'Asthma', 'CHF', 'Stroke', 'Migraine']
+LABS = ['Elevated WBC', 'High CRP', 'High Creatinine', 'Low Sodium']
+
+ROUTE_REQUESTS = 50
+PDF_REPORTS = 30
+
+
+def census(rng, count):
+    """Synthetic patient records as accepted by bulk_patients.insert_chunk()."""
+    now = datetime.utcnow()
+    for _ in range(count):
+        yield {
+            'name': f"Bench {rng.randrange(10 ** 6):06d}",
+            'gender': rng.choice(['Male', 'Female']),
+            'notes': '',
+            'age': rng.randint(18, 95),
+            'heart_rate': rng.randint(45, 160),
+            'systolic_bp': rng.randint(70, 190),
+            'diastolic_bp': rng.randint(40, 110),
+            'spo2': rng.randint(80, 100),
+            'temperature': round(rng.uniform(35.5, 40.5), 1),
+            'respiratory_rate': rng.randint(10, 32),
+            'er_visits': rng.randint(0, 5),
+            'history': rng.sample(CONDITIONS, rng.randint(0, 3)),
+            'lab_issues': rng.sample(LABS, rng.randint(0, 2)),
+            'admission_date': now - timedelta(minutes=rng.randrange(60 * 24 * 60)),
+        }
+
+
+def summarize(samples_ms):
+    samples = sorted(samples_ms)
+    return {
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+
+def bench_risk_engine(records):
+    from risk_engine import calculate_risk, calculate_risk_batch
+
+    result = {}
+    for name, explain in (('calculate_risk_us', True), ('calculate_risk_score_only_us', False)):
+        best = float('inf')
+        for _ in range(3):
+            started = time.perf_counter()
+            for data in records:
+                calculate_risk(data, explain=explain)
+            best = min(best, time.perf_counter() - started)
+        result[name] = round(best / len(records) * 1e6, 3)
+
+    started = time.perf_counter()
+    calculate_risk_batch(records)
+    result['calculate_risk_batch_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def bench_routes(client, patient_ids, rng):
+    routes = {
+        '/': lambda: '/',
+        '/patients': lambda: '/patients',
+        '/patient/<id>': lambda: f"/patient/{rng.choice(patient_ids)}",
+    }
+    result = {}
+    for name, url in routes.items():
+        client.get(url())  # warm up (template compilation, caches)
+        samples = []
+        for _ in range(ROUTE_REQUESTS):
+            started = time.perf_counter()
+            response = client.get(url())
+            samples.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"{name} returned {response.status_code}")
+        result[name] = summarize(samples)
+    return result
+
+
+def bench_pdf(directory):
+    from bench_pdf_extraction import write_corpus
+    from service_pdf import extract_data_from_pdf
+
+    paths = write_corpus(directory, PDF_REPORTS)
+    samples = []
+    for path in paths:
+        started = time.perf_counter()
+        extract_data_from_pdf(path)
+        samples.append((time.perf_counter() - started) * 1000)
+    return dict(summarize(samples), reports=len(paths))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes):
+    rng = random.Random(1234)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Configure the app for a throwaway database before importing it
+        os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['RESCORE_ON_STARTUP'] = '0'
+        # Time rendering, not page-cache hits, so results compare with older baselines
+        os.environ['RESPONSE_CACHE_TTL'] = '0'
+        from app import app, db, Patient
+        from bulk_patients import insert_chunk
+
+        results = {
+            'meta': {
+                'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'sizes': sizes,
+            },
+            'risk_engine': {},
+            'routes': {},
+        }
+
+        client = app.test_client()
+        population = 0
+        for size in sorted(sizes):
+            print(f"Growing census to {size} patients...")
+            with app.app_context():
+                while population < size:
+                    chunk = list(census(rng, min(5000, size - population)))
+                    insert_chunk(chunk)
+                    population += len(chunk)
+                patient_ids = [pid for (pid,) in db.session.query(Patient.id)]
+
+            records = list(census(rng, size))
+            results['risk_engine'][str(size)] = bench_risk_engine(records)
+            results['routes'][str(size)] = bench_routes(client, patient_ids, rng)
+            print(f"  risk engine: {results['risk_engine'][str(size)]}")
+            for route, stats in results['routes'][str(size)].items():
+                print(f"  {route:15} p50 {stats['p50_ms']:8.2f} ms   p95 {stats['p95_ms']:8.2f} ms")
+
+        print(f"Extracting {PDF_REPORTS} synthetic PDF reports...")
+        results['pdf'] = bench_pdf(tmp)
+        print(f"  extract_data_from_pdf p50 {results['pdf']['p50_ms']:.2f} ms")
+
+        with app.app_context():
+            db.engine.dispose()
+    return results
+
+
+def timings(results, prefix=''):
+    """Flattens every timing in a results file to {'a.b.c': value}."""
+    flat = {}
+    for key, value in results.items():
+        if key == 'meta':
+            continue
+        if isinstance(value, dict):
+            flat.update(timings(value, f"{prefix}{key}."))
+        elif key.endswith(('_ms', '_us')):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(current, baseline, max_regression=None):
+    """Prints the change of every timing present in both runs; returns the regressions."""
+    new, old = timings(current), timings(baseline)
+    regressions = []
+    print(f"\nChange vs baseline ({baseline['meta'].get('git_revision')}):")
+    for metric in sorted(new.keys() & old.keys()):
+        if not old[metric]:
+            continue
+        ratio = new[metric] / old[metric]
+        flag = ''
+        if max_regression and ratio > max_regression:
+            flag = '  <-- REGRESSION'
+            regressions.append(metric)
+        print(f"  {metric:55} {old[metric]:10.3f} -> {new[metric]:10.3f}  ({ratio:5.2f}x){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the risk engine, PDF parsing and HTTP routes.")
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help="Comma-separated census sizes (default: 1000,10000,100000)")
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help="JSON results file")
+    parser.add_argument('--baseline', help="Earlier results file to compare against")
+    parser.add_argument('--max-regression', type=float,
+                        help="Fail if a timing is more than this factor slower than the baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    results = run(sizes)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+"""
+Bulk patient import and export (CSV and NDJSON).
+
+Import reads records as a stream, scores each chunk with calculate_risk and
+writes the Patient rows and their creation AuditLogs with executemany-style
+bulk inserts, one transaction per chunk. Rows that cannot be imported are
+reported with their line number and skipped.
+
+Export streams rows from a server-side cursor, so memory use does not grow
+with the size of the table.
+
+Usage:
+    python bulk_patients.py import patients.csv [--format ndjson] [--chunk-size 1000]
+    python bulk_patients.py export [-o patients.ndjson] [--format ndjson]
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from collections import Counter
+from datetime import datetime
+
+from risk_engine import REQUIRED_VITALS, RULESET_VERSION, calculate_risk
+
+FORMATS = ('csv', 'ndjson')
+
+# Column order of exported files; import accepts the same columns
+# (id, risk_score and risk_label are ignored and recomputed)
+EXPORT_FIELDS = [
+    'id', 'name', 'age', 'gender', 'admission_date',
+    'heart_rate', 'systolic_bp', 'diastolic_bp', 'spo2', 'temperature', 'respiratory_rate',
+    'er_visits', 'history', 'lab_issues', 'notes', 'risk_score', 'risk_label'
+]
+
+INT_FIELDS = ('age', 'heart_rate', 'systolic_bp', 'diastolic_bp', 'spo2', 'respiratory_rate', 'er_visits')
+FLOAT_FIELDS = ('temperature',)
+LIST_FIELDS = ('history', 'lab_issues')
+
+# Rows fetched per round trip while exporting
+EXPORT_BATCH_SIZE = 1000
+
+# Row errors kept for the import summary; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(filename=None, content_type=None):
+    """Guesses the format from a file name or MIME type, defaulting to CSV."""
+    if (filename or '').lower().endswith(('.ndjson', '.jsonl')) or 'ndjson' in (content_type or ''):
+        return 'ndjson'
+    return 'csv'
+
+
+def iter_records(stream, fmt):
+    """
+    Reads records from a text stream.
+
+    Yields:
+        tuple: (line_number, record, error) - record is a dict, or None when
+        the line could not be parsed (error then says why).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+        yield line_number, record, None
+
+
+def _number(record, field, type_func):
+    value = record.get(field)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    # NDJSON numbers: int() would truncate 71.9 (and CSV rejects "71.9")
+    if isinstance(value, bool) or (type_func is int and isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"Invalid {field}: {value!r}")
+    try:
+        return type_func(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {field}: {value!r}")
+
+
+def _text(record, field):
+    # NDJSON values can be any JSON type
+    value = record.get(field)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid {field}: {value!r}")
+    return value
+
+
+def _items(record, field):
+    value = record.get(field)
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    elif not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"Invalid {field}: {value!r}")
+    return [item.strip() for item in value if item.strip()]
+
+
+def to_patient_data(record):
+    """
+    Validates one imported record and converts it to Patient column values.
+
+    Raises:
+        ValueError: When a required field is missing or a value has the wrong type.
+    """
+    name = _text(record, 'name').strip()
+    if not name:
+        raise ValueError("Missing required field: name")
+
+    data = {'name': name, 'gender': _text(record, 'gender') or None, 'notes': _text(record, 'notes')}
+    for field in INT_FIELDS:
+        data[field] = _number(record, field, int)
+    for field in FLOAT_FIELDS:
+        data[field] = _number(record, field, float)
+    for field in LIST_FIELDS:
+        data[field] = _items(record, field)
+
+    if data['age'] is None:
+        raise ValueError("Missing required field: age")
+    # A blank vital would be scored at its default (0 = critical for BP / heart rate)
+    missing = [field for field in REQUIRED_VITALS if data[field] is None]
+    if missing:
+        raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+    data['er_visits'] = data['er_visits'] or 0
+
+    admitted = record.get('admission_date')
+    try:
+        data['admission_date'] = datetime.fromisoformat(admitted) if admitted else None
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid admission_date: {admitted!r}")
+    return data
+
+
+def insert_chunk(chunk):
+    """Scores and inserts one chunk of validated records in a single transaction."""
+    from models import db, Patient, AuditLog
+    from stats import record_admission, bump_data_version
+    from cohorts import index_terms
+
+    now = datetime.utcnow()
+    mappings = []
+    for data in chunk:
+        risk = calculate_risk(data)
+        mappings.append(dict(
+            data,
+            admission_date=data['admission_date'] or now,
+            history=json.dumps(data['history']),
+            lab_issues=json.dumps(data['lab_issues']),
+            risk_score=risk['score'],
+            risk_label=risk['label'],
+            risk_notes=json.dumps(risk['notes']),
+            rule_version=RULESET_VERSION
+        ))
+
+    # return_defaults fills in the generated ids for the audit rows
+    db.session.bulk_insert_mappings(Patient, mappings, return_defaults=True)
+    db.session.bulk_insert_mappings(AuditLog, [
+        {
+            'patient_id': m['id'],
+            'timestamp': now,
+            'field_changed': "Creation",
+            'old_value': "N/A",
+            'new_value': "Patient Created",
+            'risk_change': f"Started as {m['risk_label']}"
+        }
+        for m in mappings
+    ])
+    admissions = Counter((m['admission_date'].date(), m['risk_label']) for m in mappings)
+    for (day, label), count in admissions.items():
+        record_admission(datetime.combine(day, datetime.min.time()), label, count)
+    index_terms((m['id'], data['history'], data['lab_issues']) for m, data in zip(mappings, chunk))
+    bump_data_version()
+    db.session.commit()
+
+
+def import_patients(stream, fmt='csv', chunk_size=1000, max_errors=MAX_REPORTED_ERRORS):
+    """
+    Imports patients from a CSV or NDJSON text stream.
+
+    Returns:
+        dict: 'imported' and 'failed' counts plus 'errors', a list of
+        (line_number, message) for the first max_errors rows that were skipped.
+    """
+    summary = {'imported': 0, 'failed': 0, 'errors': []}
+    chunk = []
+    for line_number, record, error in iter_records(stream, fmt):
+        if error is None:
+            try:
+                chunk.append(to_patient_data(record))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            summary['failed'] += 1
+            if len(summary['errors']) < max_errors:
+                summary['errors'].append((line_number, error))
+        if len(chunk) >= chunk_size:
+            insert_chunk(chunk)
+            summary['imported'] += len(chunk)
+            chunk = []
+    if chunk:
+        insert_chunk(chunk)
+        summary['imported'] += len(chunk)
+    return summary
+
+
+def _export_row(row):
+    record = dict(row._mapping)
+    record['admission_date'] = record['admission_date'].isoformat() if record['admission_date'] else None
+    for field in LIST_FIELDS:
+        try:
+            record[field] = json.loads(record[field]) if record[field] else []
+        except ValueError:
+            record[field] = []
+    return record
+
+
+def export_patients(fmt='csv', batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields the Patient table as CSV or NDJSON text, a batch of rows at a time.
+
+    Rows are read with yield_per from a server-side cursor as plain tuples
+    (no ORM objects), so memory stays flat however many patients there are.
+    Must be consumed inside an app context (stream_with_context in views).
+    """
+    from models import db, Patient
+
+    columns = [getattr(Patient, field) for field in EXPORT_FIELDS]
+    result = db.session.execute(
+        db.select(*columns).order_by(Patient.id).execution_options(yield_per=batch_size))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(EXPORT_FIELDS)
+
+    for rows in result.partitions():
+        for row in rows:
+            record = _export_row(row)
+            if fmt == 'csv':
+                for field in LIST_FIELDS:
+                    record[field] = ', '.join(record[field])
+                writer.writerow([record[field] for field in EXPORT_FIELDS])
+            else:
+                buffer.write(json.dumps(record) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if fmt == 'csv' and buffer.tell():
+        yield buffer.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import or export patients as CSV or NDJSON.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="Import patients from a file")
+    import_parser.add_argument('file', help="CSV or NDJSON file ('-' for stdin)")
+    import_parser.add_argument('--format', choices=FORMATS, help="Default: from the file extension")
+    import_parser.add_argument('--chunk-size', type=int, default=1000, help="Patients inserted per transaction")
+
+    export_parser = commands.add_parser('export', help="Export all patients")
+    export_parser.add_argument('-o', '--output', default='-', help="Output file (default: stdout)")
+    export_parser.add_argument('--format', choices=FORMATS, help="Default: from the file extension")
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    # No background re-scoring in a short-lived tool
+    app = create_app({'RESCORE_ON_STARTUP': False})
+
+    with app.app_context():
+        if args.command == 'import':
+            fmt = args.format or detect_format(args.file)
+            if args.file == '-':
+                summary = import_patients(sys.stdin, fmt, chunk_size=args.chunk_size)
+            else:
+                with open(args.file, newline='', encoding='utf-8') as stream:
+                    summary = import_patients(stream, fmt, chunk_size=args.chunk_size)
+            for line_number, error in summary['errors']:
+                print(f"  line {line_number}: {error}", file=sys.stderr)
+            if summary['failed'] > len(summary['errors']):
+                print(f"  ... and {summary['failed'] - len(summary['errors'])} more", file=sys.stderr)
+            print(f"Imported {summary['imported']} patients, {summary['failed']} failed.", file=sys.stderr)
+            return 0 if summary['failed'] == 0 else 1
+
+        fmt = args.format or detect_format(args.output)
+        if args.output == '-':
+            sys.stdout.writelines(export_patients(fmt))
+        else:
+            with open(args.output, 'w', newline='', encoding='utf-8') as out:
+                out.writelines(export_patients(fmt))
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
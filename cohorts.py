@@ -0,0 +1,140 @@
+"""
+Normalised clinical history and lab entries for cohort queries.
+
+Patient.history and Patient.lab_issues stay the source of truth (JSON text),
+but every entry is also written as a row of PatientCondition / PatientLab,
+tagged with the risk engine term it is recognised as. "All COPD patients" is
+then an indexed lookup instead of decoding every patient's JSON.
+
+Writers call index_terms() inside their own transaction, like the dashboard
+counters in stats.py; rebuild_cohorts() backfills existing databases.
+"""
+import json
+
+from models import db, Patient, PatientCondition, PatientLab
+from risk_engine import VALID_CONDITIONS, VALID_LABS, classify_condition, classify_lab
+from stats import bump_data_version
+
+# Patients read per round trip while rebuilding
+REBUILD_BATCH_SIZE = 1000
+
+
+def _rows(patient_id, entries, classify):
+    rows = []
+    for entry in entries or []:
+        if entry and entry.strip():
+            entry = entry.strip()[:200]
+            rows.append({'patient_id': patient_id, 'entry': entry, 'term': classify(entry)})
+    return rows
+
+
+def index_terms(patients):
+    """
+    Adds the condition and lab rows for newly written patients.
+
+    Args:
+        patients: iterable of (patient_id, history list, lab_issues list).
+        Runs in the caller's transaction; call it after the ids are flushed.
+    """
+    conditions, labs = [], []
+    for patient_id, history, lab_issues in patients:
+        conditions.extend(_rows(patient_id, history, classify_condition))
+        labs.extend(_rows(patient_id, lab_issues, classify_lab))
+    if conditions:
+        db.session.bulk_insert_mappings(PatientCondition, conditions)
+    if labs:
+        db.session.bulk_insert_mappings(PatientLab, labs)
+
+
+def reindex_terms(patients):
+    """
+    Replaces the condition and lab rows of existing patients, e.g. after the
+    vocabularies changed. Same arguments and transaction as index_terms().
+    """
+    patients = list(patients)
+    ids = [patient_id for patient_id, _, _ in patients]
+    for model in (PatientCondition, PatientLab):
+        model.query.filter(model.patient_id.in_(ids)).delete(synchronize_session=False)
+    index_terms(patients)
+
+
+def _decode(raw):
+    try:
+        items = json.loads(raw) if raw else []
+        return items if isinstance(items, list) else []
+    except ValueError:
+        return []
+
+
+def rebuild_cohorts():
+    """
+    Recomputes both tables from the Patient JSON columns (backfills, repairs).
+
+    Returns:
+        int: Number of patients indexed.
+    """
+    PatientCondition.query.delete()
+    PatientLab.query.delete()
+
+    # Plain tuples from a server-side cursor; inserts go out once per batch
+    total = 0
+    query = db.select(Patient.id, Patient.history, Patient.lab_issues).order_by(Patient.id)
+    result = db.session.execute(query.execution_options(yield_per=REBUILD_BATCH_SIZE))
+    for rows in result.partitions():
+        index_terms((pid, _decode(history), _decode(labs)) for pid, history, labs in rows)
+        total += len(rows)
+    bump_data_version()
+    db.session.commit()
+    return total
+
+
+def needs_rebuild():
+    """True for databases with patient history/labs but no indexed entries yet."""
+    if PatientCondition.query.first() is not None or PatientLab.query.first() is not None:
+        return False
+    has_entries = db.or_(Patient.history.notin_(['', '[]']), Patient.lab_issues.notin_(['', '[]']))
+    return Patient.query.filter(has_entries).first() is not None
+
+
+CONDITION_TERMS = {term.lower(): term for term in VALID_CONDITIONS}
+LAB_TERMS = {term.lower(): term for term in VALID_LABS}
+
+
+def _term_filter(model, terms, name):
+    """Matches a recognised term via the index, anything else by its exact text."""
+    name = name.strip().lower()
+    if name in terms:
+        return model.term == terms[name]
+    return db.func.lower(model.entry) == name
+
+
+def with_condition(query, condition):
+    """Restricts a Patient query to patients with the given history entry."""
+    match = _term_filter(PatientCondition, CONDITION_TERMS, condition)
+    return query.filter(Patient.id.in_(db.select(PatientCondition.patient_id).where(match)))
+
+
+def with_lab(query, lab):
+    """Restricts a Patient query to patients with the given lab indicator."""
+    match = _term_filter(PatientLab, LAB_TERMS, lab)
+    return query.filter(Patient.id.in_(db.select(PatientLab.patient_id).where(match)))
+
+
+def cohort_counts():
+    """
+    Patients per recognised condition and lab term, split by risk label.
+
+    Returns:
+        dict: {'conditions': {term: {label: count}}, 'labs': {term: {label: count}}}
+    """
+    counts = {}
+    for key, model in (('conditions', PatientCondition), ('labs', PatientLab)):
+        rows = db.session.query(model.term, Patient.risk_label,
+                                db.func.count(db.distinct(model.patient_id))) \
+            .join(Patient, Patient.id == model.patient_id) \
+            .filter(model.term.isnot(None)) \
+            .group_by(model.term, Patient.risk_label).all()
+        counts[key] = {}
+        for term, label, count in rows:
+            counts[key].setdefault(term, {})[label] = count
+    return counts
@@ -0,0 +1,73 @@
+"""
+Gunicorn settings for the production entry point (wsgi.py).
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Worker model: WEB_WORKERS processes (default: one per CPU core) with
+WEB_THREADS request threads each (gthread). Page rendering and risk scoring
+hold the GIL, so throughput scales with processes; threads cover time spent
+waiting on SQLite. Size DB_POOL_SIZE to at least WEB_THREADS.
+
+PDF job state and live feed events are kept in the database, so any worker
+can answer a job poll or resume an event stream. Under gthread every open
+live feed holds one of its worker's threads, so each worker serves at most
+half its threads as streams (LIVE_FEED_MAX_STREAMS). Dashboards are served
+by a feed-only instance with WEB_WORKER_CLASS=gevent, where an idle stream
+is a greenlet rather than an OS thread (see the README).
+
+Schema upgrades and backfills run once in the master before the workers
+are forked (the workers then find the schema up to date), and only the
+first worker starts the background re-scoring job.
+"""
+import os
+
+if os.environ.get('WEB_WORKER_CLASS') == 'gevent':
+    # Patch before the master imports the app, so its locks and threads are cooperative
+    from gevent import monkey
+    monkey.patch_all()
+
+import multiprocessing
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 8))
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+# Concurrent connections per gevent worker
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+# Restart workers now and then to bound memory growth
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('WEB_ACCESS_LOG') or None
+
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+if worker_class == 'gevent':
+    # Streams are greenlets; keep some connections for other requests
+    os.environ.setdefault('LIVE_FEED_MAX_STREAMS', str(max(1, worker_connections * 9 // 10)))
+else:
+    # Leave the other half of the threads to page requests
+    os.environ.setdefault('LIVE_FEED_MAX_STREAMS', str(max(1, threads // 2)))
+
+
+def on_starting(server):
+    """Runs the startup maintenance once, in the master, before any worker exists."""
+    from app import create_app
+    from models import db
+
+    app = create_app({'RESCORE_ON_STARTUP': False})
+    with app.app_context():
+        # No connection may be shared with the forked workers
+        db.engine.dispose()
+
+
+def pre_fork(server, worker):
+    # Re-scoring runs in one process only; the first worker inherits the flag
+    rescore = os.environ.get('RESCORE_ON_STARTUP', '1') == '1' and not getattr(server, 'rescore_assigned', False)
+    server.rescore_assigned = True
+    worker.rescore = rescore
+
+
+def post_fork(server, worker):
+    if not worker.rescore:
+        os.environ['RESCORE_ON_STARTUP'] = '0'
@@ -0,0 +1,206 @@
+"""
+Bulk ingestion of referral PDFs.
+
+Walks a directory, parses every PDF in parallel with extract_data_from_pdf,
+scores it with calculate_risk and inserts the Patient and its creation
+AuditLog in batched transactions.
+
+Progress is appended to a progress file after every committed batch, so an
+interrupted run picks up where it stopped. Files that cannot be ingested are
+listed in a CSV error report and not marked as done, so the next run retries
+them.
+
+Usage:
+    python ingest_pdfs.py /path/to/referrals [--workers 8] [--batch-size 200]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from multiprocessing import Pool
+
+from risk_engine import REQUIRED_VITALS, RULESET_VERSION, calculate_risk
+from service_pdf import extract_data_from_pdf
+
+# Referrals without all of these go to the error report instead of being scored
+REQUIRED_FIELDS = ('name', 'age') + REQUIRED_VITALS
+
+
+def find_pdfs(directory):
+    """Yields paths of all .pdf files under directory, in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith('.pdf'):
+                yield os.path.join(root, name)
+
+
+def parse_file(path):
+    """
+    Worker: extract and score one PDF.
+
+    Returns:
+        tuple: (path, data, risk_result, error) - error is None on success.
+    """
+    try:
+        data = extract_data_from_pdf(path)
+        missing = [field for field in REQUIRED_FIELDS if data.get(field) in (None, '')]
+        if missing:
+            return path, None, None, f"Missing required field(s): {', '.join(missing)}"
+        return path, data, calculate_risk(data), None
+    except Exception as e:
+        return path, None, None, str(e)
+
+
+def load_progress(progress_file):
+    if not os.path.exists(progress_file):
+        return set()
+    with open(progress_file) as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def insert_batch(batch):
+    """Inserts one batch of parsed files in a single transaction."""
+    from models import db, Patient, AuditLog
+    from stats import record_admission, bump_data_version
+    from cohorts import index_terms
+
+    admitted_at = datetime.utcnow()
+    patients = []
+    for path, data, risk in batch:
+        patients.append(Patient(
+            name=data['name'],
+            age=data['age'],
+            gender=data.get('gender'),
+            admission_date=admitted_at,
+            heart_rate=data.get('heart_rate'),
+            systolic_bp=data.get('systolic_bp'),
+            diastolic_bp=data.get('diastolic_bp'),
+            spo2=data.get('spo2'),
+            temperature=data.get('temperature'),
+            respiratory_rate=data.get('respiratory_rate'),
+            er_visits=0,
+            history=json.dumps(data.get('history', [])),
+            lab_issues=json.dumps(data.get('lab_issues', [])),
+            notes=f"Imported from {os.path.basename(path)}",
+            risk_score=risk['score'],
+            risk_label=risk['label'],
+            risk_notes=json.dumps(risk['notes']),
+            rule_version=RULESET_VERSION
+        ))
+    db.session.add_all(patients)
+    db.session.flush() # Generate IDs
+
+    db.session.add_all([
+        AuditLog(
+            patient_id=patient.id,
+            field_changed="Creation",
+            old_value="N/A",
+            new_value="Patient Created",
+            risk_change=f"Started as {patient.risk_label}"
+        )
+        for patient in patients
+    ])
+    for label, count in Counter(p.risk_label for p in patients).items():
+        record_admission(admitted_at, label, count)
+    index_terms((patient.id, data.get('history', []), data.get('lab_issues', []))
+                for patient, (path, data, risk) in zip(patients, batch))
+    bump_data_version()
+    db.session.commit()
+
+
+def ingest(directory, workers=None, batch_size=200, progress_file=None, error_report=None):
+    """
+    Ingests every not-yet-processed PDF under directory.
+
+    Returns:
+        dict: Counts of 'ingested', 'failed' and 'skipped' files plus 'elapsed' seconds.
+    """
+    progress_file = progress_file or os.path.join(directory, '.ingest_progress')
+    error_report = error_report or os.path.join(directory, 'ingest_errors.csv')
+
+    done = load_progress(progress_file)
+    all_paths = list(find_pdfs(directory))
+    paths = [p for p in all_paths if os.path.relpath(p, directory) not in done]
+    summary = {'ingested': 0, 'failed': 0, 'skipped': len(all_paths) - len(paths)}
+
+    from models import db
+
+    started = time.perf_counter()
+    batch = []
+
+    def flush(progress, errors_writer):
+        if batch:
+            try:
+                insert_batch(batch)
+            except Exception as e:
+                # Reported, and left for the next run
+                db.session.rollback()
+                summary['failed'] += len(batch)
+                errors_writer.writerows([os.path.relpath(path, directory), f"Insert failed: {e}"]
+                                        for path, _, _ in batch)
+            else:
+                summary['ingested'] += len(batch)
+                # Only mark files as done once their rows are committed
+                progress.writelines(os.path.relpath(path, directory) + '\n' for path, _, _ in batch)
+                progress.flush()
+            batch.clear()
+        elapsed = time.perf_counter() - started
+        handled = summary['ingested'] + summary['failed']
+        print(f"  {handled}/{len(paths)} files, {handled / elapsed if elapsed else 0:.1f} files/s")
+
+    with open(progress_file, 'a') as progress, open(error_report, 'a', newline='') as errors, \
+            Pool(processes=workers) as pool:
+        errors_writer = csv.writer(errors)
+        if errors.tell() == 0:
+            errors_writer.writerow(['file', 'error'])
+
+        chunksize = max(1, min(32, len(paths) // ((workers or os.cpu_count() or 1) * 4)))
+        for path, data, risk, error in pool.imap_unordered(parse_file, paths, chunksize=chunksize):
+            if error:
+                summary['failed'] += 1
+                errors_writer.writerow([os.path.relpath(path, directory), error])
+            else:
+                batch.append((path, data, risk))
+            if len(batch) >= batch_size:
+                flush(progress, errors_writer)
+        flush(progress, errors_writer)
+
+    summary['elapsed'] = time.perf_counter() - started
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-ingest referral PDFs into the patient database.")
+    parser.add_argument('directory', help="Directory to scan (recursively) for PDF files")
+    parser.add_argument('--workers', type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument('--batch-size', type=int, default=200, help="Patients inserted per transaction")
+    parser.add_argument('--progress-file', help="Resume file (default: <directory>/.ingest_progress)")
+    parser.add_argument('--error-report', help="CSV of failed files (default: <directory>/ingest_errors.csv)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"Not a directory: {args.directory}")
+
+    from app import create_app
+
+    # No background re-scoring in a short-lived tool (nor across the fork of its worker pool)
+    app = create_app({'RESCORE_ON_STARTUP': False})
+
+    with app.app_context():
+        print(f"Ingesting PDFs from {args.directory}...")
+        summary = ingest(args.directory, workers=args.workers, batch_size=args.batch_size,
+                         progress_file=args.progress_file, error_report=args.error_report)
+
+    rate = (summary['ingested'] + summary['failed']) / summary['elapsed'] if summary['elapsed'] else 0
+    print(f"Ingested {summary['ingested']} files, {summary['failed']} failed, "
+          f"{summary['skipped']} already done, in {summary['elapsed']:.1f}s ({rate:.1f} files/s).")
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Opt-in per-request instrumentation.
+
+While enabled, every request records how long it spent in each phase:
+  * db       - SQL statements (count and total time, via engine events);
+  * template - Jinja rendering (Flask's template signals);
+  * risk     - calculate_risk() calls wrapped in phase('risk');
+  * pdf      - synchronous pdfplumber parsing wrapped in phase('pdf').
+Phases can overlap (a lazy load during rendering counts as db and template).
+
+The breakdown is returned in a Server-Timing header, so it shows up in the
+browser's network panel, and aggregated into latency histograms rendered in
+the Prometheus text format (the /metrics route).
+
+When disabled, the engine listeners and signals are not connected; the
+request hooks and phase() only check a flag / context variable.
+"""
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from flask import before_render_template, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PHASES = ('db', 'template', 'risk', 'pdf')
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_timings', default=None)
+_NOT_TIMED = nullcontext()
+
+
+class _Phase:
+    __slots__ = ('timings', 'name', 'started')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class RequestTimings:
+    """Seconds spent per phase during one request, plus the SQL statement count."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+        self._query_started = None
+        self._render_started = []
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        """Server-Timing header value (durations in milliseconds)."""
+        entries = []
+        for name in PHASES:
+            if name in self.phases:
+                entry = f"{name};dur={self.phases[name] * 1000:.2f}"
+                if name == 'db':
+                    entry += f';desc="{self.queries} queries"'
+                entries.append(entry)
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ', '.join(entries)
+
+
+def phase(name):
+    """
+    Context manager timing a block as the given phase of the current request.
+    Outside an instrumented request it is a shared no-op.
+    """
+    timings = _current.get()
+    if timings is None:
+        return _NOT_TIMED
+    return timings.phase(name)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set (Prometheus semantics)."""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series['buckets'][i] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = _labels(self.label_names, labels)
+            for bound, count in zip(self.buckets, series['buckets']):
+                lines.append(f"{self.name}_bucket{{{base},le=\"{bound}\"}} {count}")
+            lines.append(f"{self.name}_bucket{{{base},le=\"+Inf\"}} {series['count']}")
+            lines.append(f"{self.name}_sum{{{base}}} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label set."""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def _labels(names, values):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+# SQLAlchemy and template signal handlers; they only act inside an instrumented request
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _current.get()
+    if timings is not None:
+        timings._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _current.get()
+    if timings is not None and timings._query_started is not None:
+        timings.add('db', time.perf_counter() - timings._query_started)
+        timings.queries += 1
+        timings._query_started = None
+
+
+def _before_render(sender, template, context, **extra):
+    timings = _current.get()
+    if timings is not None:
+        timings._render_started.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    timings = _current.get()
+    if timings is not None and timings._render_started:
+        timings.add('template', time.perf_counter() - timings._render_started.pop())
+
+
+class Instrumentation:
+    """
+    Request hooks plus the in-process metrics registry.
+
+    Args:
+        app (Flask, optional): Registers the request hooks (see init_app).
+        enabled (bool): Start recording straight away.
+    """
+
+    def __init__(self, app=None, enabled=False):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.requests = Counter('http_requests_total', "Requests handled.", ('endpoint', 'method', 'status'))
+        self.latency = Histogram('http_request_duration_seconds', "Request latency.", ('endpoint', 'method'))
+        self.phase_latency = Histogram('http_request_phase_duration_seconds',
+                                       "Time spent per request in each phase.", ('endpoint', 'phase'))
+        self.queries = Counter('http_request_db_queries_total', "SQL statements executed by requests.",
+                               ('endpoint',))
+        if app is not None:
+            self.init_app(app)
+        if enabled:
+            self.enable()
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._end_request)
+
+    def enable(self):
+        """Connects the engine listeners and template signals."""
+        if self.enabled:
+            return
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        before_render_template.connect(_before_render)
+        template_rendered.connect(_rendered)
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        event.remove(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', _after_cursor_execute)
+        before_render_template.disconnect(_before_render)
+        template_rendered.disconnect(_rendered)
+
+    def _start_request(self):
+        if self.enabled:
+            request.timings_token = _current.set(RequestTimings())
+
+    def _finish_request(self, response):
+        timings = _current.get()
+        if timings is None:
+            return response
+        total = timings.elapsed()
+        response.headers['Server-Timing'] = timings.server_timing(total)
+
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            self.requests.inc((endpoint, request.method, str(response.status_code)))
+            self.latency.observe((endpoint, request.method), total)
+            for name, seconds in timings.phases.items():
+                self.phase_latency.observe((endpoint, name), seconds)
+            if timings.queries:
+                self.queries.inc((endpoint,), timings.queries)
+        return response
+
+    def _end_request(self, exc):
+        token = getattr(request, 'timings_token', None)
+        if token is not None:
+            request.timings_token = None
+            _current.reset(token)
+
+    def render_metrics(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.latency, self.phase_latency, self.queries):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
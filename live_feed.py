@@ -0,0 +1,213 @@
+"""
+Live dashboard feed (server-sent events).
+
+add_patient and update_patient publish a small delta in the transaction of
+the change:
+  * admission - the new patient's row for the recent admissions table;
+  * update    - new risk score/label, with the old label so the dashboard
+                can move the patient between its counters.
+The dashboard applies them to its charts and table in place instead of
+reloading the page.
+
+Events are rows of the LiveEvent table, so their ids come from the database
+and mean the same in every server process: a client that reconnects with
+Last-Event-ID to another worker gets exactly the events it missed. Each
+process runs one watcher thread that, while anyone is subscribed, loads new
+events every poll_interval seconds (at once when this process published one)
+into a ring buffer of the last `history` events guarded by a condition
+variable. Subscribers are generators blocked in Condition.wait() until a
+newer event id exists, so idle connections cost no CPU. Under a threaded
+server each one holds a thread, so max_streams caps them per process; with
+gevent workers (monkey-patched threading) a subscriber is a greenlet.
+
+Writes that publish no delta (bulk imports, re-scoring, CLI tools) still
+bump the data version. Every event carries the version its write produced;
+when the versions skip one, or the data version moved past the last event,
+subscribers get a 'refresh' event (reload the page).
+"""
+import json
+import threading
+from collections import deque
+
+# A published event's id is checked against this to prune older rows
+PRUNE_EVERY = 100
+
+
+class LiveFeed:
+    """
+    Args:
+        history (int): Events kept (in memory and in the database) for replay to reconnecting clients.
+        heartbeat (float): Seconds between keep-alive comments on idle streams.
+        poll_interval (float): Seconds between checks for new events (0 = no watcher).
+        max_streams (int): Concurrent streams served by this process (0 = no limit).
+        busy_retry (float): Seconds a client turned away by max_streams waits before reconnecting.
+    """
+
+    def __init__(self, history=200, heartbeat=15, poll_interval=1, max_streams=0, busy_retry=30):
+        self.history = history
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+        self.max_streams = max_streams
+        self.busy_retry = busy_retry
+        self.version = None
+        self.subscribers = 0
+        self._events = deque(maxlen=history)
+        self._last_id = None
+        # Highest event id this process no longer (or never) buffered
+        self._dropped_through = 0
+        self._refreshes = 0
+        self._cond = threading.Condition()
+        self._poll_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._watcher = None
+
+    def publish(self, event, data, version):
+        """
+        Records an event in the caller's transaction; call it after
+        bump_data_version(), with the new data_version(). Subscribers get it
+        once the transaction commits; call notify() after the commit.
+        """
+        from models import db, LiveEvent
+
+        row = LiveEvent(event=event, payload=json.dumps(dict(data, version=version)))
+        db.session.add(row)
+        db.session.flush()
+        if row.id % PRUNE_EVERY == 0:
+            LiveEvent.query.filter(LiveEvent.id <= row.id - self.history).delete(synchronize_session=False)
+
+    def latest_id(self):
+        """Id of the newest stored event (0 if none); a page rendered now reflects it. Needs an app context."""
+        from models import db, LiveEvent
+
+        return db.session.execute(db.select(db.func.max(LiveEvent.id))).scalar() or 0
+
+    def notify(self):
+        """Makes the watcher load new events now instead of at its next poll."""
+        self._wake.set()
+
+    def poll(self):
+        """
+        Loads the events committed since the last poll, by any process, and
+        wakes the subscribers. Needs an app context.
+        """
+        from models import db, LiveEvent
+        from stats import data_version
+
+        with self._poll_lock:
+            # One read transaction, so the events and the data version agree
+            query = db.select(LiveEvent.id, LiveEvent.event, LiveEvent.payload) \
+                .order_by(LiveEvent.id.desc()).limit(self.history)
+            if self._last_id is not None:
+                query = query.where(LiveEvent.id > self._last_id)
+            rows = db.session.execute(query).all()[::-1]
+            current_version = data_version()
+            db.session.rollback()
+
+            with self._cond:
+                first_poll = self._last_id is None
+                if rows and (first_poll or len(rows) == self.history):
+                    # Anything older was not loaded
+                    self._dropped_through = max(self._dropped_through, rows[0].id - 1)
+                refresh = False
+                for row in rows:
+                    version = json.loads(row.payload).get('version')
+                    if version is not None:
+                        # A skipped version is a write that published no event
+                        if not first_poll and self.version is not None and version > self.version + 1:
+                            refresh = True
+                        self.version = max(self.version or 0, version)
+                    if len(self._events) == self._events.maxlen:
+                        self._dropped_through = self._events[0][0]
+                    self._events.append((row.id, row.event, row.payload))
+                if rows:
+                    self._last_id = rows[-1].id
+                elif first_poll:
+                    self._last_id = 0
+
+                if first_poll or self.version is None:
+                    self.version = current_version
+                elif current_version > self.version:
+                    refresh = True
+                    self.version = current_version
+                if refresh:
+                    self._refreshes += 1
+                if rows or refresh:
+                    self._cond.notify_all()
+
+    def _events_after(self, last_id):
+        """Buffered events newer than last_id, or None when some were already dropped."""
+        if last_id >= self._last_id:
+            return []
+        if last_id < self._dropped_through:
+            return None
+        return [e for e in self._events if e[0] > last_id]
+
+    def stream(self, last_id=None):
+        """
+        Yields the text/event-stream body for one subscriber, starting after
+        last_id (the client's Last-Event-ID, or the latest_id() its page was
+        rendered with) or at the current event. Call poll() first so this
+        process has caught up with the database.
+        """
+        with self._cond:
+            busy = bool(self.max_streams) and self.subscribers >= self.max_streams
+            if not busy:
+                self.subscribers += 1
+                current = self._last_id or 0
+                if last_id is None or last_id > current:
+                    last_id = current
+                refreshes = self._refreshes
+        if busy:
+            # Every stream holds a server thread: turn the client away rather than
+            # starve page requests; it reconnects after busy_retry
+            yield f"retry: {int(self.busy_retry * 1000)}\n\n"
+            return
+        try:
+            yield f"retry: 3000\nid: {last_id}\n\n"
+            while True:
+                with self._cond:
+                    events = self._events_after(last_id)
+                    if events == [] and refreshes == self._refreshes:
+                        self._cond.wait(self.heartbeat)
+                        events = self._events_after(last_id)
+                    refresh = refreshes != self._refreshes
+                    refreshes = self._refreshes
+                    current = self._last_id
+                if events is None or refresh:
+                    # Missed events, or a change that published none: the client reloads
+                    last_id = current
+                    yield f"id: {last_id}\nevent: refresh\ndata: {{}}\n\n"
+                elif events:
+                    last_id = events[-1][0]
+                    yield ''.join(f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
+                                  for event_id, event, payload in events)
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    def start(self, app):
+        """Starts the watcher, once (concurrent first requests race here)."""
+        with self._cond:
+            if not self.poll_interval or self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, args=(app,), name='live-feed', daemon=True)
+            self._watcher.start()
+
+    def _watch(self, app):
+        from models import db
+
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if not self.subscribers:
+                continue
+            with app.app_context():
+                try:
+                    self.poll()
+                except Exception:
+                    # e.g. the database is locked by a long import; try again next time
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
@@ -0,0 +1,95 @@
+"""
+Schema upgrades for existing databases.
+
+db.create_all() only creates missing tables; it never touches tables that
+already exist. This module brings older risk_system.db files up to date by
+adding any (nullable) column and creating any index declared on the models
+that the database lacks, and dropping indexes the models replaced.
+Columns that became required are backfilled instead (SQLite cannot add a
+NOT NULL constraint to an existing column).
+"""
+from sqlalchemy import inspect, text
+from models import db
+
+# Indexes superseded by a differently declared one: {table: [index names]}
+OBSOLETE_INDEXES = {
+    # Replaced by ix_patient_name_nocase, which the (case-insensitive) LIKE search can use
+    'patient': ['ix_patient_name'],
+}
+
+
+def missing_schema(conn):
+    """
+    Compares the database with the models.
+
+    Returns:
+        tuple: (missing tables, missing columns as (table, column), missing indexes,
+                obsolete index names still present)
+    """
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    missing_tables, missing_columns, missing_indexes, obsolete_indexes = [], [], [], []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            missing_tables.append(table)
+            continue
+        columns = {col['name'] for col in inspector.get_columns(table.name)}
+        missing_columns.extend((table, column) for column in table.columns if column.name not in columns)
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        missing_indexes.extend(index for index in table.indexes if index.name not in existing)
+        obsolete_indexes.extend(name for name in OBSOLETE_INDEXES.get(table.name, ()) if name in existing)
+    return missing_tables, missing_columns, missing_indexes, obsolete_indexes
+
+
+def upgrade_schema(engine=None):
+    """
+    Creates missing tables, columns and indexes and drops obsolete indexes. Safe to run repeatedly; an
+    up-to-date database is only inspected (no create_all, no write lock), so
+    every worker process can run it on startup.
+
+    Returns:
+        list: Names of the columns ('table.column') and indexes that were created,
+              and of the indexes dropped (prefixed with '-').
+    """
+    engine = engine or db.engine
+    with engine.connect() as conn:
+        if not any(missing_schema(conn)):
+            return []
+
+    created = []
+    with engine.begin() as conn:
+        db.metadata.create_all(conn)
+        _, missing_columns, missing_indexes, obsolete_indexes = missing_schema(conn)
+        for table, column in missing_columns:
+            # New columns must be nullable; existing rows start as NULL
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            created.append(f'{table.name}.{column.name}')
+        for index in missing_indexes:
+            index.create(conn)
+            created.append(index.name)
+        for name in obsolete_indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+            created.append(f'-{name}')
+    return created
+
+
+def backfill_admission_dates(engine=None):
+    """
+    Gives patients without an admission date (direct imports, legacy rows) the
+    time of their creation audit entry, or the current time. The patient list
+    pages by admission date. An up-to-date database is only read.
+
+    Returns:
+        int: Number of patients updated.
+    """
+    engine = engine or db.engine
+    with engine.connect() as conn:
+        if conn.execute(text('SELECT 1 FROM patient WHERE admission_date IS NULL LIMIT 1')).first() is None:
+            return 0
+    with engine.begin() as conn:
+        return conn.execute(text(
+            "UPDATE patient SET admission_date = COALESCE("
+            "(SELECT MIN(timestamp) FROM audit_log WHERE audit_log.patient_id = patient.id), "
+            "CURRENT_TIMESTAMP) WHERE admission_date IS NULL"
+        )).rowcount
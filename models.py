@@ -1,15 +1,35 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
 import json
 
 db = SQLAlchemy()
 
+
+def configure_sqlite(engine, busy_timeout_ms):
+    """
+    Puts SQLite databases in WAL mode (readers no longer block the writer)
+    and makes writers wait up to busy_timeout_ms for the lock instead of
+    failing with "database is locked". No-op for other databases.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # In-memory databases keep their own journal mode
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.close()
+
+
 class Patient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     age = db.Column(db.Integer, nullable=False)
     gender = db.Column(db.String(10))
-    admission_date = db.Column(db.DateTime, default=datetime.utcnow)
+    admission_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     # Clinical Parameters
     heart_rate = db.Column(db.Integer)
@@ -28,36 +48,61 @@ class Patient(db.Model):
     risk_score = db.Column(db.Integer, default=0)
     risk_label = db.Column(db.String(20), default="LOW")
     risk_notes = db.Column(db.Text, default="")
+    # risk_engine.RULESET_VERSION the stored risk was computed with (NULL = before versioning)
+    rule_version = db.Column(db.Integer)
     
     # Clinical Notes
     notes = db.Column(db.Text, default="")
 
-    # Relationship to Logs
-    logs = db.relationship('AuditLog', backref='patient', lazy=True, cascade="all, delete-orphan")
+    # Relationship to Logs. 'dynamic' returns a query rather than loading the
+    # whole (potentially very long) timeline; page it with fetch_audit_page().
+    logs = db.relationship('AuditLog', backref='patient', lazy='dynamic', cascade="all, delete-orphan")
+
+    # Composite indexes backing the keyset-paginated, filtered patient list
+    __table_args__ = (
+        db.Index('ix_patient_admission', 'admission_date', 'id'),
+        db.Index('ix_patient_risk_admission', 'risk_label', 'admission_date', 'id'),
+        # Name prefix search: SQLite's LIKE is case-insensitive, so only a
+        # NOCASE index can serve it
+        db.Index('ix_patient_name_nocase', db.text('name COLLATE NOCASE')),
+        # Finding patients scored under an outdated ruleset (rescore.py)
+        db.Index('ix_patient_rule_version', 'rule_version', 'id'),
+    )
+
+    # Entries are also indexed one row each in PatientCondition / PatientLab
+    # (see cohorts.py) so cohorts can be queried in SQL
+    conditions = db.relationship('PatientCondition', cascade="all, delete-orphan")
+    labs = db.relationship('PatientLab', cascade="all, delete-orphan")
+
+    def _parsed_list(self, column):
+        """
+        Decodes a JSON list column once per instance. The result is memoized
+        against the raw text, so assigning a new value re-parses on next access.
+        """
+        raw = getattr(self, column)
+        memo = self.__dict__.get('_parsed_' + column)
+        if memo is None or memo[0] != raw:
+            try:
+                items = json.loads(raw) if raw else []
+                items = [i for i in items if i and i.strip()]
+            except:
+                items = []
+            memo = (raw, items)
+            # Stored in __dict__ directly: not a mapped attribute
+            self.__dict__['_parsed_' + column] = memo
+        return list(memo[1])
 
     @property
     def history_list(self):
-        try:
-            items = json.loads(self.history) if self.history else []
-            return [i for i in items if i and i.strip()]
-        except:
-            return []
+        return self._parsed_list('history')
 
     @property
     def lab_issues_list(self):
-        try:
-            items = json.loads(self.lab_issues) if self.lab_issues else []
-            return [i for i in items if i and i.strip()]
-        except:
-            return []
+        return self._parsed_list('lab_issues')
 
     @property
     def risk_notes_list(self):
-        try:
-            items = json.loads(self.risk_notes) if self.risk_notes else []
-            return [i for i in items if i and i.strip()]
-        except:
-            return []
+        return self._parsed_list('risk_notes')
 
     def to_dict(self):
         """Helper to convert object to dict for the Risk Engine"""
@@ -92,4 +137,101 @@ class AuditLog(db.Model):
     new_value = db.Column(db.String(200))
     
  
-    risk_change = db.Column(db.String(100))
\ No newline at end of file
+    risk_change = db.Column(db.String(100))
+
+    def to_dict(self):
+        """Helper to serialise a timeline entry for the JSON API"""
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S') if self.timestamp else None,
+            'field_changed': self.field_changed,
+            'old_value': self.old_value,
+            'new_value': self.new_value,
+            'risk_change': self.risk_change
+        }
+
+    # Per-patient timeline lookups (newest first)
+    __table_args__ = (
+        db.Index('ix_audit_log_patient_timestamp', 'patient_id', 'timestamp'),
+    )
+
+
+class PatientCondition(db.Model):
+    """One clinical history entry of a patient (normalised from Patient.history)."""
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    entry = db.Column(db.String(200), nullable=False)
+    # VALID_CONDITIONS term the entry was recognised as, None if unrecognised
+    term = db.Column(db.String(50))
+
+    __table_args__ = (
+        db.Index('ix_patient_condition_term', 'term', 'patient_id'),
+        db.Index('ix_patient_condition_patient', 'patient_id'),
+    )
+
+
+class PatientLab(db.Model):
+    """One lab indicator of a patient (normalised from Patient.lab_issues)."""
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patient.id'), nullable=False)
+    entry = db.Column(db.String(200), nullable=False)
+    # VALID_LABS term the entry was recognised as, None if unrecognised
+    term = db.Column(db.String(50))
+
+    __table_args__ = (
+        db.Index('ix_patient_lab_term', 'term', 'patient_id'),
+        db.Index('ix_patient_lab_patient', 'patient_id'),
+    )
+
+
+class RiskLabelStat(db.Model):
+    """Running patient count per risk label (dashboard donut)."""
+    risk_label = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyRiskStat(db.Model):
+    """Running patient count per admission day and risk label (dashboard trend)."""
+    day = db.Column(db.Date, primary_key=True)
+    risk_label = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DataVersion(db.Model):
+    """Counter bumped by every patient write; cached pages are keyed on it (see response_cache.py)."""
+    name = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class PDFExtractionCache(db.Model):
+    """Extraction results keyed by '<sha256 of upload>:<page limit>' (see pdf_cache.py)."""
+    key = db.Column(db.String(100), primary_key=True)
+    result = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class PDFJob(db.Model):
+    """A background PDF extraction (see pdf_jobs.py); any server process can report its state."""
+    id = db.Column(db.String(32), primary_key=True)
+    # pending, done or error
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    submitted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, index=True)
+
+
+class LiveEvent(db.Model):
+    """
+    A dashboard delta (see live_feed.py). Written in the transaction of the
+    change it describes; its id is the SSE event id in every server process.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Ids are never reused, even after the oldest events are pruned
+    __table_args__ = {'sqlite_autoincrement': True}
@@ -0,0 +1,124 @@
+"""
+Cache of PDF extraction results keyed by the SHA-256 of the uploaded bytes.
+
+Re-uploading the same report (common while a clinician fixes a form) returns
+the earlier result instead of parsing with pdfplumber again. Entries live in
+the PDFExtractionCache table so they survive restarts, and are evicted by age
+and by count (least recently used first). A hit only writes (to refresh
+last_used) when the entry was last touched touch_interval seconds ago, so
+cache reads do not queue on SQLite's write lock.
+"""
+import hashlib
+import json
+import tempfile
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from models import db, PDFExtractionCache
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Upload(namedtuple('Upload', ['file', 'digest', 'size'])):
+    """A spooled upload: a seekable file object, its SHA-256 hex digest and size in bytes."""
+
+
+def spool_upload(file_storage, max_memory, chunk_size=CHUNK_SIZE):
+    """
+    Reads an uploaded file into a SpooledTemporaryFile, hashing it in the same
+    pass. The data stays in memory unless it exceeds max_memory bytes, in which
+    case it spills to an anonymous temporary file.
+
+    Returns:
+        Upload: The spooled file (rewound), its digest and size. Close the file when done.
+    """
+    digest = hashlib.sha256()
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    size = 0
+    while True:
+        chunk = file_storage.stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        spooled.write(chunk)
+        size += len(chunk)
+    spooled.seek(0)
+    return Upload(spooled, digest.hexdigest(), size)
+
+
+def cache_key(digest, max_pages=None):
+    """Results depend on the page limit, so it is part of the key."""
+    return f"{digest}:{max_pages or 0}"
+
+
+class PDFCache:
+    """
+    Args:
+        max_entries (int): Entries kept before the least recently used are evicted.
+        max_age (int): Seconds an entry stays valid after it was stored.
+        touch_interval (int): Seconds before a hit refreshes the entry's last_used again.
+    """
+
+    def __init__(self, max_entries=1000, max_age=7 * 24 * 3600, touch_interval=300):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """Returns the cached extraction result for key, or None."""
+        entry = db.session.get(PDFExtractionCache, key)
+        now = datetime.utcnow()
+        if entry is not None and now - entry.created_at > timedelta(seconds=self.max_age):
+            db.session.delete(entry)
+            db.session.commit()
+            entry = None
+
+        if entry is None:
+            self._count(hit=False)
+            return None
+
+        # LRU order only needs to be approximate
+        if entry.last_used is None or now - entry.last_used > timedelta(seconds=self.touch_interval):
+            entry.last_used = now
+            db.session.commit()
+        self._count(hit=True)
+        return json.loads(entry.result)
+
+    def put(self, key, result):
+        """Stores result under key and evicts entries beyond max_entries."""
+        now = datetime.utcnow()
+        db.session.merge(PDFExtractionCache(key=key, result=json.dumps(result),
+                                            created_at=now, last_used=now))
+        db.session.flush()
+
+        overflow = PDFExtractionCache.query.count() - self.max_entries
+        if overflow > 0:
+            oldest = db.session.query(PDFExtractionCache.key) \
+                .order_by(PDFExtractionCache.last_used.asc()).limit(overflow)
+            PDFExtractionCache.query.filter(PDFExtractionCache.key.in_(oldest.scalar_subquery())) \
+                .delete(synchronize_session=False)
+        db.session.commit()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else 0.0,
+            'entries': PDFExtractionCache.query.count(),
+            'max_entries': self.max_entries,
+            'max_age': self.max_age,
+        }
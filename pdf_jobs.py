@@ -0,0 +1,197 @@
+"""
+Background PDF extraction jobs.
+
+pdfplumber parsing is CPU-bound, so uploads are handed to a process pool and
+the request returns a job id straight away. Clients poll job_status() (the
+/upload_pdf/jobs/<job_id> route) until the extracted fields are ready.
+
+Job state lives in the PDFJob table rather than in memory: with several
+server processes a poll can land on any of them, not just the one whose pool
+runs the job. The owning process records the outcome when the job finishes.
+Timeouts are judged from submitted_at, so a job whose process died is also
+reported as failed.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from flask import current_app
+
+from models import db, PDFJob
+from service_pdf import extract_data_from_pdf
+
+
+class QueueFullError(Exception):
+    """Raised when the number of unfinished jobs has reached max_queue."""
+
+
+def _run_extraction(source, max_pages=None):
+    """
+    Worker entry point: parse the PDF. source is either the raw bytes or the
+    path of a spilled upload, which is removed afterwards.
+    """
+    try:
+        return extract_data_from_pdf(source, max_pages=max_pages)
+    finally:
+        if isinstance(source, str) and os.path.exists(source):
+            os.remove(source)
+
+
+class PDFJobQueue:
+    """
+    Process pool plus the jobs it runs.
+
+    Args:
+        max_workers (int): Worker processes parsing PDFs.
+        max_queue (int): Maximum unfinished (queued or running) jobs in this process.
+        timeout (float): Seconds after which an unfinished job is reported as failed.
+        result_ttl (float): Seconds a finished job's result stays available.
+        max_pages (int, optional): Pages read per PDF (None = all).
+        on_result (callable, optional): Called as on_result(key, result) in an
+            app context when a job with a key extracts a non-empty result.
+    """
+
+    def __init__(self, max_workers=2, max_queue=32, timeout=60, result_ttl=300, max_pages=None, on_result=None):
+        self.max_workers = max_workers
+        self.max_pages = max_pages
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.on_result = on_result
+        self._executor = None
+        # Unfinished jobs of this process: job_id -> (future, source, submitted)
+        self._running = {}
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def _get_executor(self):
+        # Created lazily so importing the app does not fork worker processes
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _expire(self, now):
+        """Stops waiting on overdue jobs of this process."""
+        for job_id, entry in list(self._running.items()):
+            if entry is None or now - entry[2] <= self.timeout:
+                continue
+            # A running worker cannot be interrupted; stop counting it instead.
+            # A job that never started still owns its spilled upload, so remove it here.
+            future, source, _ = entry
+            if future.cancel() and isinstance(source, str) and os.path.exists(source):
+                os.remove(source)
+            del self._running[job_id]
+
+    def pending_count(self):
+        """Number of jobs queued or running in this process."""
+        with self._lock:
+            self._expire(time.time())
+            return len(self._running)
+
+    def submit(self, source, key=None):
+        """
+        Queues a PDF for extraction. Needs an app context. source is the
+        document's bytes or a file path; a file is deleted once parsed.
+        key is an optional caller tag (e.g. a cache key) passed to on_result.
+
+        Returns:
+            str: The job id.
+        Raises:
+            QueueFullError: If max_queue jobs are already unfinished.
+        """
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire(now)
+            if len(self._running) >= self.max_queue:
+                raise QueueFullError(f"PDF queue is full ({self.max_queue} jobs pending)")
+            self._running[job_id] = None  # Holds the slot while the row is written
+
+        try:
+            # Forget jobs finished more than result_ttl ago, and those abandoned by a dead process
+            utcnow = datetime.utcnow()
+            PDFJob.query.filter(db.or_(
+                PDFJob.finished_at < utcnow - timedelta(seconds=self.result_ttl),
+                db.and_(PDFJob.finished_at.is_(None),
+                        PDFJob.submitted_at < utcnow - timedelta(seconds=self.timeout + self.result_ttl))
+            )).delete(synchronize_session=False)
+            db.session.add(PDFJob(id=job_id, status='pending', submitted_at=utcnow))
+            db.session.commit()
+
+            with self._lock:
+                future = self._get_executor().submit(_run_extraction, source, self.max_pages)
+                self._running[job_id] = (future, source, now)
+        except Exception:
+            with self._lock:
+                self._running.pop(job_id, None)
+            raise
+
+        future.add_done_callback(partial(self._finished, current_app._get_current_object(), job_id, key))
+        return job_id
+
+    def _finished(self, app, job_id, key, future):
+        """Records a job's outcome (runs on the pool's result thread)."""
+        with self._lock:
+            self._running.pop(job_id, None)
+        if future.cancelled():
+            # Timed out before it started; job_status() reports the timeout
+            return
+
+        with app.app_context():
+            try:
+                job = db.session.get(PDFJob, job_id)
+                if job is None or job.status != 'pending':
+                    return
+                job.finished_at = datetime.utcnow()
+                result = None
+                if future.exception() is not None:
+                    job.status, job.error = 'error', str(future.exception())
+                elif job.finished_at - job.submitted_at > timedelta(seconds=self.timeout):
+                    job.status, job.error = 'error', f"Timed out after {self.timeout}s"
+                else:
+                    result = future.result()
+                    job.status, job.result = 'done', json.dumps(result)
+                db.session.commit()
+                if result and key and self.on_result is not None:
+                    self.on_result(key, result)
+            except Exception as e:
+                # The row stays pending and is reported as timed out
+                db.session.rollback()
+                app.logger.warning("Could not record PDF job %s: %s", job_id, e)
+            finally:
+                db.session.remove()
+
+    def job_status(self, job_id):
+        """
+        Needs an app context.
+
+        Returns:
+            dict or None: {'job_id', 'status': pending|done|error, 'result' | 'error'}
+            or None for unknown (or expired) job ids.
+        """
+        job = db.session.get(PDFJob, job_id)
+        if job is None:
+            return None
+
+        status = {'job_id': job_id}
+        if job.status == 'pending':
+            if datetime.utcnow() - job.submitted_at > timedelta(seconds=self.timeout):
+                status.update(status='error', error=f"Timed out after {self.timeout}s")
+            else:
+                status['status'] = 'pending'
+        elif job.status == 'error':
+            status.update(status='error', error=job.error)
+        else:
+            status.update(status='done', result=json.loads(job.result))
+        return status
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,142 @@
+"""
+Slow-query log and N+1 detector.
+
+While enabled, every SQL statement is timed through the engine events:
+  * statements slower than slow_ms are logged with their parameters;
+  * inside a request, statements are grouped by shape (the SQL with literals
+    and expanded IN lists folded); a shape executed repeat_threshold times or
+    more is logged as a likely N+1 pattern (typically a lazy relationship
+    touched in a template loop);
+  * each endpoint keeps a summary of its query counts (requests, total,
+    last, max), which tests use as a query budget per page.
+
+Off by default; when disabled no engine listeners are connected.
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_current = ContextVar('request_queries', default=None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAM_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+# Longest parameter repr written to the slow-query log
+MAX_LOGGED_PARAMETERS = 500
+
+
+def query_shape(statement):
+    """The statement with literals and IN (?, ?, ...) lists folded, for grouping."""
+    shape = _LITERALS.sub('?', statement)
+    shape = _PARAM_LISTS.sub('(?)', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+class QueryLog:
+    """
+    Args:
+        app (Flask, optional): Registers the request hooks and uses app.logger.
+        slow_ms (float): Statements taking at least this long are logged (0 logs all).
+        repeat_threshold (int): Executions of one shape per request reported as N+1.
+        enabled (bool): Connect the engine listeners straight away.
+    """
+
+    def __init__(self, app=None, slow_ms=100, repeat_threshold=5, enabled=False):
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.enabled = False
+        self.logger = None
+        self._lock = threading.Lock()
+        self._summary = {}
+        if app is not None:
+            self.init_app(app)
+        if enabled:
+            self.enable()
+
+    def init_app(self, app):
+        self.logger = app.logger
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._end_request)
+
+    def enable(self):
+        if self.enabled:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # The start time lives on the execution context, which is discarded with the
+    # statement, so a statement that raises leaves nothing behind on the pooled connection
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_log_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'query_log_started', None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= self.slow_ms and self.logger is not None:
+            shown = repr(parameters)
+            if len(shown) > MAX_LOGGED_PARAMETERS:
+                shown = shown[:MAX_LOGGED_PARAMETERS] + '...'
+            self.logger.warning("Slow query (%.1f ms): %s | parameters: %s",
+                                elapsed_ms, _SPACES.sub(' ', statement).strip(), shown)
+        shapes = _current.get()
+        if shapes is not None:
+            shapes[query_shape(statement)] += 1
+
+    def _start_request(self):
+        if self.enabled:
+            request.query_log_token = _current.set(Counter())
+
+    def _finish_request(self, response):
+        shapes = _current.get()
+        if shapes is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        for shape, count in self.repeated(shapes):
+            self.logger.warning("Possible N+1 in %s: %d x %s", endpoint, count, shape)
+
+        total = sum(shapes.values())
+        with self._lock:
+            entry = self._summary.setdefault(endpoint, {'requests': 0, 'queries': 0, 'last': 0, 'max': 0})
+            entry['requests'] += 1
+            entry['queries'] += total
+            entry['last'] = total
+            entry['max'] = max(entry['max'], total)
+        return response
+
+    def _end_request(self, exc):
+        token = getattr(request, 'query_log_token', None)
+        if token is not None:
+            request.query_log_token = None
+            _current.reset(token)
+
+    def repeated(self, shapes):
+        """(shape, count) pairs at or above repeat_threshold, most frequent first."""
+        return [(shape, count) for shape, count in shapes.most_common() if count >= self.repeat_threshold]
+
+    def summary(self):
+        """Query counts per endpoint: {endpoint: {'requests', 'queries', 'last', 'max'}}."""
+        with self._lock:
+            return {endpoint: dict(entry) for endpoint, entry in self._summary.items()}
+
+    def reset(self):
+        with self._lock:
+            self._summary.clear()
@@ -0,0 +1,206 @@
+"""
+Background re-scoring after a risk rule change.
+
+Every patient stores the risk_engine.RULESET_VERSION its risk was computed
+with. When the version is bumped, rescore_stale() walks the patients still
+on an older version in id order, a chunk per transaction, recomputes their
+risk and writes the label changes to AuditLog and the dashboard counters in
+batches. The chunk's condition/lab rows are re-classified as well, since a
+new ruleset may change the vocabularies. A short pause between chunks leaves
+the database to live traffic.
+
+Patients missing a required vital are left alone: scoring them would use
+the engine's defaults (0 = critical for BP and heart rate). They keep their
+stored risk until the vitals are entered on the patient page.
+
+The stored version doubles as the progress marker: re-scored rows drop out
+of the stale set, so an interrupted run simply resumes on the next start.
+"""
+import json
+import threading
+import time
+
+from models import db, Patient, AuditLog
+from risk_engine import REQUIRED_VITALS, RULESET_VERSION, calculate_risk
+
+# Columns needed to score a patient (no ORM objects are loaded)
+SCORE_COLUMNS = [
+    Patient.id, Patient.age, Patient.heart_rate, Patient.systolic_bp, Patient.spo2,
+    Patient.temperature, Patient.respiratory_rate, Patient.er_visits,
+    Patient.history, Patient.lab_issues, Patient.risk_label, Patient.rule_version,
+    Patient.admission_date,
+]
+
+
+def _is_outdated():
+    return db.or_(Patient.rule_version.is_(None), Patient.rule_version < RULESET_VERSION)
+
+
+def _is_stale():
+    return db.and_(_is_outdated(), *(getattr(Patient, field).isnot(None) for field in REQUIRED_VITALS))
+
+
+def stale_count():
+    """Number of patients with all required vitals whose stored risk predates RULESET_VERSION."""
+    return Patient.query.filter(_is_stale()).count()
+
+
+def _decode(raw):
+    try:
+        return json.loads(raw) if raw else []
+    except ValueError:
+        return []
+
+
+def rescore_chunk(after_id=0, chunk_size=500):
+    """
+    Re-scores the next chunk of stale patients with id > after_id and commits.
+    Outdated patients missing a vital only have their conditions/labs re-indexed.
+
+    A row is only written if it is still stale, so a concurrent edit (which
+    re-scores under the current version) is never overwritten.
+
+    Returns:
+        tuple: (last_id, rescored, label_changes) - last_id is None when no
+        stale patients are left.
+    """
+    from stats import record_label_changes, bump_data_version
+    from cohorts import reindex_terms
+
+    rows = db.session.execute(
+        db.select(*SCORE_COLUMNS)
+        .where(_is_outdated(), Patient.id > after_id)
+        .order_by(Patient.id)
+        .limit(chunk_size)
+    ).all()
+    if not rows:
+        return None, 0, 0
+
+    patients = Patient.__table__
+    update = db.update(patients) \
+        .where(patients.c.id == db.bindparam('patient_id'), _is_stale()) \
+        .values(risk_score=db.bindparam('new_score'), risk_label=db.bindparam('new_label'),
+                risk_notes=db.bindparam('new_notes'), rule_version=RULESET_VERSION)
+    rescored = 0
+    changes = []
+    logs = []
+    terms = []
+    for row in rows:
+        data = {
+            'age': row.age, 'heart_rate': row.heart_rate, 'systolic_bp': row.systolic_bp,
+            'spo2': row.spo2, 'temperature': row.temperature,
+            'respiratory_rate': row.respiratory_rate, 'er_visits': row.er_visits or 0,
+            'history': _decode(row.history), 'lab_issues': _decode(row.lab_issues),
+        }
+        if any(data[field] is None for field in REQUIRED_VITALS):
+            terms.append((row.id, data['history'], data['lab_issues']))
+            continue
+        risk = calculate_risk(data)
+        result = db.session.execute(update, {
+            'patient_id': row.id,
+            'new_score': risk['score'],
+            'new_label': risk['label'],
+            'new_notes': json.dumps(risk['notes'])
+        })
+        if not result.rowcount:
+            continue
+        rescored += 1
+        terms.append((row.id, data['history'], data['lab_issues']))
+        if risk['label'] != row.risk_label:
+            changes.append((row.admission_date, row.risk_label, risk['label']))
+            logs.append({
+                'patient_id': row.id,
+                'field_changed': 'Rule Version',
+                'old_value': f"v{row.rule_version or 0}",
+                'new_value': f"v{RULESET_VERSION}",
+                'risk_change': f"{row.risk_label} -> {risk['label']}"
+            })
+
+    if logs:
+        db.session.bulk_insert_mappings(AuditLog, logs)
+    record_label_changes(changes)
+    if terms:
+        reindex_terms(terms)
+    if rescored:
+        bump_data_version()
+    db.session.commit()
+    return rows[-1].id, rescored, len(changes)
+
+
+def rescore_stale(chunk_size=500, pause=0.1, stop_event=None, progress=None):
+    """
+    Re-scores every stale patient, chunk by chunk.
+
+    Args:
+        chunk_size (int): Patients per transaction.
+        pause (float): Seconds to sleep between chunks (throttling).
+        stop_event (threading.Event, optional): Set to stop after the current chunk.
+        progress (dict, optional): Updated in place with 'rescored' and 'label_changes'.
+
+    Returns:
+        dict: 'rescored' and 'label_changes' counts.
+    """
+    progress = progress if progress is not None else {}
+    progress.setdefault('rescored', 0)
+    progress.setdefault('label_changes', 0)
+    last_id = 0
+    while not (stop_event and stop_event.is_set()):
+        last_id, rescored, changed = rescore_chunk(last_id, chunk_size)
+        if last_id is None:
+            break
+        progress['rescored'] += rescored
+        progress['label_changes'] += changed
+        if pause:
+            time.sleep(pause)
+    return progress
+
+
+class RescoreJob:
+    """
+    Runs rescore_stale() on a daemon thread inside an app context.
+
+    Args:
+        chunk_size (int): Patients per transaction.
+        pause (float): Seconds between chunks.
+    """
+
+    def __init__(self, chunk_size=500, pause=0.1):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.progress = {'rescored': 0, 'label_changes': 0}
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        """Starts the job unless it is already running."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name='rescore', daemon=True)
+        self._thread.start()
+
+    def _run(self, app):
+        with app.app_context():
+            try:
+                rescore_stale(self.chunk_size, self.pause, self._stop, self.progress)
+            except Exception as e:
+                # The stale rows stay stale; the next start picks them up
+                db.session.rollback()
+                self.error = str(e)
+            finally:
+                db.session.remove()
+
+    def stop(self, timeout=None):
+        """Asks the job to stop after the current chunk and waits for it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self):
+        return dict(self.progress, running=self.running, error=self.error,
+                    ruleset_version=RULESET_VERSION)
@@ -0,0 +1,104 @@
+"""
+Cache of rendered pages, invalidated by patient writes.
+
+Entries are keyed on the request path (with its query string) and the data
+version counter that every patient write bumps in its own transaction
+(stats.bump_data_version). A write therefore invalidates all cached pages at
+once, in every process, at the cost of one primary-key read per request.
+Entries also expire after ttl seconds (the dashboard trend depends on the
+date) and the least recently used are evicted beyond max_entries.
+
+Responses carry an ETag (digest of the body) and Cache-Control: no-cache, so
+clients revalidate every time; an unchanged page is answered with 304 Not
+Modified without querying or rendering anything.
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, request, session
+
+from stats import data_version
+
+CacheEntry = namedtuple('CacheEntry', ['body', 'mimetype', 'etag', 'stored_at'])
+
+
+class ResponseCache:
+    """
+    Args:
+        max_entries (int): Pages kept before the least recently used are evicted.
+        ttl (float): Seconds a page stays valid (0 disables caching).
+    """
+
+    def __init__(self, max_entries=256, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Returns the entry stored for key under this data version, or None."""
+        with self._lock:
+            if version != self._version:
+                # Everything cached belongs to an older version
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.stored_at > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, entry):
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'ttl': self.ttl,
+                    'version': self._version, 'hits': self.hits, 'misses': self.misses}
+
+    def cached(self, view):
+        """Decorator for GET views whose output depends only on the URL and the patient data."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pages showing flashed messages are specific to one session
+            if not self.ttl or request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            version = data_version()
+            entry = self.get(key, version)
+            if entry is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                response.add_etag()
+                entry = CacheEntry(response.get_data(), response.mimetype, response.get_etag()[0],
+                                   time.monotonic())
+                self.put(key, version, entry)
+            else:
+                response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+                response.set_etag(entry.etag)
+
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return wrapper
@@ -1,6 +1,234 @@
-def calculate_risk(data):
+import json
+import keyword
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# Scoring bands, critical triggers, vocabularies and label thresholds.
+# Bump "version" in the file whenever any of them changes: patients scored
+# under an older version are then re-scored in the background (see rescore.py).
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'risk_rules.json')
+
+# Size of the per-vocabulary cache of normalised free-text entries
+MATCH_CACHE_SIZE = 4096
+
+# Band bound keywords and the comparison each one compiles to
+BOUND_OPERATORS = {'min': '>=', 'max': '<=', 'above': '>', 'below': '<'}
+
+
+def load_rules(path=RULES_FILE):
+    """Reads a rule table (see risk_rules.json)."""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+RULES = load_rules()
+RULESET_VERSION = RULES['version']
+
+# Recognised clinical history entries (substring match, case-insensitive)
+VALID_CONDITIONS = RULES['vocabularies']['conditions']
+
+# Recognised lab indicators (substring match, case-insensitive)
+VALID_LABS = RULES['vocabularies']['labs']
+
+# Defaults used when a vital is missing
+VITAL_DEFAULTS = RULES['defaults']
+
+# Vitals a record needs before it can be scored. A missing one would be scored
+# at its default, and 0 for heart rate / blood pressure reads as critical.
+REQUIRED_VITALS = ('heart_rate', 'systolic_bp', 'spo2', 'temperature', 'respiratory_rate')
+
+
+def _compile_matcher(terms):
+    """
+    Builds a cached classifier for a keyword vocabulary.
+
+    A single alternation regex rejects non-matching entries in one scan; when
+    it hits, the vocabulary is walked in order so the first listed term that
+    occurs in the entry wins, exactly as the original nested loops did.
+    """
+    lowered = [(term, term.lower()) for term in terms]
+    pattern = re.compile("|".join(re.escape(low) for _, low in lowered))
+
+    @lru_cache(maxsize=MATCH_CACHE_SIZE)
+    def match(normalized):
+        if not pattern.search(normalized):
+            return None
+        for term, low in lowered:
+            if low in normalized:
+                return term
+        return None
+
+    return match
+
+
+def _normalize(entry):
+    return entry.strip().lower()
+
+
+def _classifier(terms):
+    match = _compile_matcher(terms)
+    return lambda entry: match(_normalize(entry))
+
+
+CLASSIFIERS = {name: _classifier(terms) for name, terms in RULES['vocabularies'].items()}
+
+
+def classify_condition(entry):
+    """Returns the VALID_CONDITIONS term recognised in entry, or None."""
+    return CLASSIFIERS['conditions'](entry)
+
+
+def classify_lab(entry):
+    """Returns the VALID_LABS term recognised in entry, or None."""
+    return CLASSIFIERS['labs'](entry)
+
+
+def _condition(var, band):
+    """Python source of the test `var` is in band, e.g. 'v_age >= 60 and v_age <= 75'."""
+    parts = [f"{var} {op} {band[key]!r}" for key, op in BOUND_OPERATORS.items() if key in band]
+    if not parts:
+        raise ValueError(f"Band has no bound ({', '.join(BOUND_OPERATORS)}): {band}")
+    return " and ".join(parts)
+
+
+def _note(template, var):
+    """Python source of an f-string rendering template with {value} bound to var."""
+    escaped = template.replace('{', '{{').replace('}', '}}').replace('{{value}}', '{' + var + '}')
+    return 'f' + repr(escaped)
+
+
+def _variable(field):
+    if not field.isidentifier() or keyword.iskeyword(field):
+        raise ValueError(f"Invalid field name in rule table: {field!r}")
+    return 'v_' + field
+
+
+def compile_rules(rules, classifiers=None, explain=True):
+    """
+    Compiles a rule table into a scoring function with the same signature and
+    result as calculate_risk(data, explain).
+
+    The table is turned into straight-line Python source (one if/elif chain
+    per field, first matching band wins) and compiled once, so a call costs
+    the same comparisons as hand-written branches. A band or list step
+    without a "note" scores silently. With explain=False no notes or lists
+    are built at all and the result is {'score', 'label', 'critical'}.
+
+    Raises:
+        ValueError: When the table is malformed (unknown vocabulary, a band
+        without bounds, a field without a default, ...).
     """
-    Calculates patient risk based on deterministic rules.
+    if classifiers is None:
+        classifiers = {name: _classifier(terms) for name, terms in rules['vocabularies'].items()}
+    consts = {}
+
+    def const(value):
+        name = f"_c{len(consts)}"
+        consts[name] = value
+        return name
+
+    list_fields = [step['field'] for step in rules['scoring'] if 'vocabulary' in step]
+    unrecognized_keys = [step['unrecognized_key'] for step in rules['scoring'] if 'unrecognized_key' in step]
+    numeric_fields = [rule['field'] for rule in rules['critical']] + \
+        [step['field'] for step in rules['scoring'] if 'bands' in step]
+
+    src = ["def calculate_risk(data):",
+           "    score = 0"]
+    if explain:
+        src += ["    notes = []", "    critical_triggers = []"]
+        src += [f"    {key} = []" for key in unrecognized_keys]
+    else:
+        src.append("    critical = False")
+    for field in dict.fromkeys(numeric_fields):
+        if field not in rules['defaults']:
+            raise ValueError(f"No default for field {field!r}")
+        src.append(f"    {_variable(field)} = data.get({field!r}, {rules['defaults'][field]!r})")
+    for field in list_fields:
+        src.append(f"    {_variable(field)} = data.get({field!r}, [])")
+
+    # CRITICAL ESCALATION PROTOCOL
+    for rule in rules['critical']:
+        var = _variable(rule['field'])
+        src.append(f"    if {_condition(var, rule)}:")
+        if explain:
+            src.append(f"        critical_triggers.append({_note(rule['note'], var)})")
+        else:
+            src.append("        critical = True")
+
+    # STANDARD SCORING ENGINE
+    for step in rules['scoring']:
+        var = _variable(step['field'])
+        if 'bands' in step:
+            for i, band in enumerate(step['bands']):
+                src.append(f"    {'if' if i == 0 else 'elif'} {_condition(var, band)}:")
+                src.append(f"        score += {int(band['points'])}")
+                if explain and band.get('note'):
+                    src.append(f"        notes.append({band['note']!r})")
+            continue
+
+        if step['vocabulary'] not in classifiers:
+            raise ValueError(f"Unknown vocabulary {step['vocabulary']!r}")
+        classify = const(classifiers[step['vocabulary']])
+        src += ["    for entry in " + var + ":",
+                "        if not entry or not entry.strip():",
+                "            continue",
+                f"        if {classify}(entry):",
+                f"            score += {int(step['points'])}"]
+        if not explain:
+            continue
+        if step.get('note'):
+            src.append(f"            notes.append({_note(step['note'], 'entry')})")
+        if step.get('unrecognized_key') or step.get('unrecognized_note'):
+            src.append("        else:")
+            if step.get('unrecognized_key'):
+                src.append(f"            {step['unrecognized_key']}.append(entry)")
+            if step.get('unrecognized_note'):
+                src.append(f"            notes.append({_note(step['unrecognized_note'], 'entry')})")
+
+    # FINAL CLASSIFICATION
+    if explain:
+        src += ["    if critical_triggers:",
+                f"        label = {rules['critical_label']!r}",
+                f"        notes.insert(0, {rules['critical_note']!r})",
+                "        notes.extend(critical_triggers)"]
+    else:
+        src += ["    if critical:",
+                f"        label = {rules['critical_label']!r}"]
+    for threshold in sorted(rules['labels'], key=lambda t: t['min_score'], reverse=True):
+        src.append(f"    elif score >= {threshold['min_score']!r}:")
+        src.append(f"        label = {threshold['label']!r}")
+    src += ["    else:",
+            f"        label = {rules['default_label']!r}"]
+    if explain:
+        src.append("    return {'score': score, 'label': label, 'notes': notes"
+                   + "".join(f", {key!r}: {key}" for key in unrecognized_keys) + "}")
+    else:
+        src.append("    return {'score': score, 'label': label, 'critical': critical}")
+
+    namespace = dict(consts)
+    exec(compile("\n".join(src) + "\n", f"<risk rules v{rules['version']}>", 'exec'), namespace)
+    scorer = namespace['calculate_risk']
+    scorer.source = "\n".join(src)
+    return scorer
+
+
+# Inputs the rules read; changing anything else cannot change the score
+SCORING_FIELDS = tuple(dict.fromkeys(
+    [rule['field'] for rule in RULES['critical']] + [step['field'] for step in RULES['scoring']]))
+
+# Free-text list inputs (history, lab_issues)
+LIST_FIELDS = tuple(step['field'] for step in RULES['scoring'] if 'vocabulary' in step)
+
+_calculate_risk = compile_rules(RULES, CLASSIFIERS)
+_calculate_score = compile_rules(RULES, CLASSIFIERS, explain=False)
+
+
+def calculate_risk(data, explain=True):
+    """
+    Calculates patient risk based on deterministic rules (risk_rules.json).
     
     Input:
         data (dict): Dictionary containing patient parameters.
@@ -14,6 +242,8 @@ def calculate_risk(data):
         - history (list of strings, e.g., ['Diabetes'])
         - er_visits (int) - Last 30 days
         - lab_issues (list of strings, e.g., ['Elevated WBC'])
+        explain (bool): False skips building the notes (no string formatting
+            or list allocation) for callers that only need score and label.
 
     Output:
         dict: {
@@ -21,148 +251,112 @@ def calculate_risk(data):
             'label': str (LOW, MEDIUM, HIGH),
             'notes': list (Explanation of score)
         }
+        or, with explain=False: {'score': int, 'label': str, 'critical': bool}
     """
-    score = 0
-    notes = []
-    critical_triggers = []
-
-    age = data.get('age', 0)
-    hr = data.get('heart_rate', 0)
-    bp = data.get('systolic_bp', 0)
-    spo2 = data.get('spo2', 100)
-    temp = data.get('temperature', 37.0)
-    resp = data.get('respiratory_rate', 18)
-    history = data.get('history', [])
-    er_visits = data.get('er_visits', 0)
-    lab_issues = data.get('lab_issues', [])
+    if explain:
+        return _calculate_risk(data)
+    return _calculate_score(data)
 
-    # CRITICAL ESCALATION PROTOCOL
 
-    if spo2 < 85:
-        critical_triggers.append(f"Critical: SpO2 {spo2}% (<85%)")
-    
-    if bp < 80:
-        critical_triggers.append(f"Critical: Systolic BP {bp} (<80 mmHg)")
-        
-    if hr > 140:
-        critical_triggers.append(f"Critical: Heart Rate {hr} (>140 bpm)")
+def _count_recognized(entries, classify):
+    """Counts non-blank entries that classify() recognises."""
+    count = 0
+    for entry in entries or []:
+        if entry and entry.strip() and classify(entry):
+            count += 1
+    return count
 
-    # STANDARD SCORING ENGINE
 
-    if 60 <= age <= 75:
-        score += 1
-        notes.append("Age 60-75")
-    elif age > 75:
-        score += 2
-        notes.append("Age >75")
-
-  
-    if 100 <= hr <= 120:
-        score += 1
-        notes.append("HR 100-120")
-    elif hr > 120:
-        score += 2
-        notes.append("HR >120")
-
-
-    if bp < 90:
-        score += 2
-        notes.append("Systolic BP <90")
-
-
-    if 90 <= spo2 <= 93:
-        score += 1
-        notes.append("SpO2 90-93%")
-    elif spo2 < 90:
-        score += 2
-        notes.append("SpO2 <90%")
-
-
-    if 38 <= temp <= 39:
-        score += 1
-        notes.append("Temp 38-39°C")
-    elif temp > 39:
-        score += 2
-        notes.append("Temp >39°C")
-
-    if resp > 24:
-        score += 1
-        notes.append("Resp Rate >24")
-
-    # Clinical History
-    valid_conditions = [
-        "Diabetes", "COPD", "Cardiac Disease", "Cardiac",
-        "Hypertension", "High Blood Pressure",
-        "Stroke", "CVA",
-        "Kidney Disease", "Renal Failure",
-        "Cancer", "Malignancy",
-        "Asthma",
-        "Heart Failure", "CHF",
-        "Pneumonia"
-    ]
-    condition_count = 0
-    unrecognized_conditions = []
-
-    for cond in history:
-        if not cond or not cond.strip():
-            continue
-        matched = False
-        for valid in valid_conditions:
-            if valid.lower() in cond.lower():
-                condition_count += 1
-                score += 1
-                notes.append(f"History: {cond}")
-                matched = True
-                break
-        
-        if not matched:
-            unrecognized_conditions.append(cond)
-            notes.append(f"WARNING: Unrecognized condition '{cond}'")
-
-    if 2 <= er_visits <= 3:
-        score += 1
-        notes.append("ER Visits 2-3")
-    elif er_visits > 3:
-        score += 2
-        notes.append("ER Visits >3")
-
-    # Lab Indicators
-    valid_labs = ["Elevated WBC", "High Creatinine", "High CRP"]
-    
-    for lab in lab_issues:
-        if not lab or not lab.strip():
-            continue
-            
-        matched = False
-        for valid in valid_labs:
-            if valid.lower() in lab.lower():
-                score += 1
-                notes.append(f"Lab: {lab}")
-                matched = True
-                break
-        
-        if not matched:
-            notes.append(f"WARNING: Unrecognized lab '{lab}'")
+def _to_columns(records):
+    """
+    Normalises batch input into a dict of columns.
 
-    # FINAL CLASSIFICATION
-  
-    label = "LOW"
-    
-    if critical_triggers:
-        label = "HIGH"
-        notes.insert(0, " CRITICAL ESCALATION TRIGGERED ")
-        notes.extend(critical_triggers)
+    Accepts either a list of patient dicts (converted once) or a dict of
+    columns (lists / NumPy arrays keyed by field name).
+    """
+    if isinstance(records, dict):
+        columns = dict(records)
+        lengths = {len(col) for col in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All columns must have the same length")
+        n = lengths.pop() if lengths else 0
     else:
-        if score >= 6:
-            label = "HIGH"
-        elif score >= 3:
-            label = "MEDIUM"
+        records = list(records)
+        n = len(records)
+        columns = {
+            field: [r.get(field, default) for r in records]
+            for field, default in VITAL_DEFAULTS.items()
+        }
+        for field in LIST_FIELDS:
+            columns[field] = [r.get(field, []) for r in records]
+
+    for field, default in VITAL_DEFAULTS.items():
+        if field in columns:
+            columns[field] = np.asarray(columns[field], dtype=np.float64)
         else:
-            label = "LOW"
+            columns[field] = np.full(n, default, dtype=np.float64)
+    return columns, n
+
+
+def _band_mask(column, band):
+    """Boolean array of the column values that fall in band."""
+    mask = np.ones(len(column), dtype=bool)
+    for key, op in (('min', np.greater_equal), ('max', np.less_equal),
+                    ('above', np.greater), ('below', np.less)):
+        if key in band:
+            mask &= op(column, band[key])
+    return mask
+
+
+def calculate_risk_batch(records):
+    """
+    Vectorized version of calculate_risk() for scoring many patients at once.
+
+    Input:
+        records: list of patient dicts (same keys as calculate_risk), or a
+        dict of columns, e.g. {'age': np.array([...]), 'history': [[...], ...]}.
+        Missing vitals fall back to the same defaults as calculate_risk().
+
+    Output:
+        dict: {
+            'score': np.ndarray (int),
+            'label': np.ndarray (str: LOW, MEDIUM, HIGH),
+            'critical': np.ndarray (bool, critical escalation triggered)
+        }
+    """
+    cols, n = _to_columns(records)
+
+    # CRITICAL ESCALATION PROTOCOL
+    critical = np.zeros(n, dtype=bool)
+    for rule in RULES['critical']:
+        critical |= _band_mask(cols[rule['field']], rule)
+
+    # STANDARD SCORING ENGINE (first matching band per field, as in calculate_risk)
+    score = np.zeros(n, dtype=np.int64)
+    for step in RULES['scoring']:
+        if 'bands' in step:
+            taken = np.zeros(n, dtype=bool)
+            for band in step['bands']:
+                mask = _band_mask(cols[step['field']], band) & ~taken
+                score += np.where(mask, int(band['points']), 0)
+                taken |= mask
+            continue
+
+        # History and labs are free text, so they are counted once per patient
+        entries = cols.get(step['field'])
+        if entries is not None:
+            classify = CLASSIFIERS[step['vocabulary']]
+            score += int(step['points']) * np.fromiter(
+                (_count_recognized(e, classify) for e in entries), dtype=np.int64, count=n)
+
+    # FINAL CLASSIFICATION
+    thresholds = sorted(RULES['labels'], key=lambda t: t['min_score'], reverse=True)
+    label = np.select([critical] + [score >= t['min_score'] for t in thresholds],
+                      [RULES['critical_label']] + [t['label'] for t in thresholds],
+                      default=RULES['default_label'])
 
     return {
         "score": score,
         "label": label,
-        "notes": notes,
-        "unrecognized_conditions": unrecognized_conditions
-    }
\ No newline at end of file
+        "critical": critical
+    }
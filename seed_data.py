@@ -1,11 +1,15 @@
-from app import app, db, Patient, AuditLog
-from risk_engine import calculate_risk
+from app import create_app, db, Patient, AuditLog
+from risk_engine import RULESET_VERSION, calculate_risk
+from stats import record_admission, bump_data_version
+from cohorts import index_terms
 import json
 
 def seed_database():
     """
     Populates the database with varied sample patient data for testing and demonstration.
     """
+    # No background re-scoring in a short-lived tool
+    app = create_app({'RESCORE_ON_STARTUP': False})
     with app.app_context():
         # Option to clear existing data? Maybe not, just append.
         print("Seeding database with sample patients...")
@@ -100,10 +104,13 @@ def seed_database():
                 notes=data['notes'],
                 risk_score=risk_res['score'],
                 risk_label=risk_res['label'],
-                risk_notes=json.dumps(risk_res['notes'])
+                risk_notes=json.dumps(risk_res['notes']),
+                rule_version=RULESET_VERSION
             )
             db.session.add(patient)
             db.session.flush() # Generate ID
+            record_admission(patient.admission_date, patient.risk_label)
+            index_terms([(patient.id, data['history'], data['lab_issues'])])
 
             # Create Initial Audit Log
             log = AuditLog(
@@ -114,7 +121,8 @@ def seed_database():
                 risk_change=f"Started as {risk_res['label']}"
             )
             db.session.add(log)
-        
+
+        bump_data_version()
         db.session.commit()
         print(f"Successfully added {len(samples)} sample patients.")
 
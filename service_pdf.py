@@ -1,77 +1,264 @@
+import io
 import pdfplumber
 import re
 
-def extract_data_from_pdf(filepath):
+from collections import namedtuple
+
+# One row per label variant. Every rule is tried only where its anchor (a
+# lower-case keyword contained in the label, `offset` characters in) occurs,
+# so a single scan for anchors replaces one full-text search per field.
+#   kind: 'value' -> group 1 converted with `convert`
+#         'pair'  -> "BP 120/80": systolic and diastolic together
+#         'list'  -> label only; the value runs to the next '.' (see LIST_END)
+Rule = namedtuple('Rule', ['name', 'field', 'kind', 'anchor', 'offset', 'pattern', 'convert'])
+
+
+def _rule(name, field, kind, anchor, offset, pattern, convert=None):
+    return Rule(name, field, kind, anchor, offset, re.compile(pattern, re.IGNORECASE), convert)
+
+
+RULES = [
+    _rule('patient_name', 'name', 'value', 'name', 8, r"Patient Name[:\s]+([a-zA-Z ]+)(?:[\(\n,]|$)", str),
+    _rule('name', 'name', 'value', 'name', 0, r"Name[:\s]+([a-zA-Z ]+)(?:[\(\n,]|$)", str),
+    _rule('age', 'age', 'value', 'age', 0, r"Age[:\s]+(\d+)", int),
+    _rule('age_in_brackets', 'age', 'value', 'age', 1, r"\(Age[:\s]+(\d+)", int),
+    _rule('gender', 'gender', 'value', 'gender', 0, r"Gender[:\s]+(Male|Female|Other)", str),
+    _rule('heart_rate', 'heart_rate', 'value', 'heart rate', 0, r"Heart Rate[:\s]+(\d+)", int),
+    _rule('hr', 'heart_rate', 'value', 'hr', 0, r"HR[:\s]+(\d+)", int),
+    # BP: "BP xxx/yyy" wins anywhere in the document; separate systolic/diastolic are fallbacks
+    _rule('bp', 'blood_pressure', 'pair', 'bp', 0, r"BP[:\s]+(\d+)/(\d+)"),
+    _rule('blood_pressure', 'blood_pressure', 'pair', 'blood pressure', 0, r"Blood Pressure[:\s]+(\d+)/(\d+)"),
+    _rule('systolic_bp', 'systolic_bp', 'value', 'bp', 9, r"Systolic BP[:\s]+(\d+)", int),
+    _rule('sbp', 'systolic_bp', 'value', 'bp', 1, r"SBP[:\s]+(\d+)", int),
+    _rule('diastolic_bp', 'diastolic_bp', 'value', 'bp', 10, r"Diastolic BP[:\s]+(\d+)", int),
+    _rule('dbp', 'diastolic_bp', 'value', 'bp', 1, r"DBP[:\s]+(\d+)", int),
+    _rule('spo2', 'spo2', 'value', 'spo2', 0, r"SpO2[:\s]+(\d+)", int),
+    _rule('saturation', 'spo2', 'value', 'saturation', 0, r"Saturation[:\s]+(\d+)", int),
+    # Temperature: Temp or Temperature, handle "C"
+    _rule('temperature', 'temperature', 'value', 'temp', 0, r"Temperature[:\s]+([\d\.]+)", float),
+    _rule('temp', 'temperature', 'value', 'temp', 0, r"Temp[:\s]+([\d\.]+)", float),
+    _rule('respiratory_rate', 'respiratory_rate', 'value', 'resp', 0, r"Respiratory Rate[:\s]+(\d+)", int),
+    _rule('resp', 'respiratory_rate', 'value', 'resp', 0, r"Resp[:\s]+(\d+)", int),
+    # Comma-separated lists: text after the label up to the first '.' (or "Wait for it")
+    _rule('medical_history', 'history', 'list', 'history', 8, r"Medical History[:\s]+"),
+    _rule('clinical_history', 'history', 'list', 'history', 9, r"Clinical History[:\s]+"),
+    _rule('history', 'history', 'list', 'history', 0, r"History[:\s]+"),
+    _rule('lab_results', 'lab_issues', 'list', 'lab', 0, r"Lab Results[:\s]+"),
+    _rule('lab_indicators', 'lab_issues', 'list', 'lab', 0, r"Lab Indicators[:\s]+"),
+    _rule('labs', 'lab_issues', 'list', 'lab', 0, r"Labs[:\s]+"),
+]
+
+VALUE_FIELDS = ['name', 'age', 'gender', 'heart_rate', 'spo2', 'temperature', 'respiratory_rate']
+BP_FALLBACK_FIELDS = ['systolic_bp', 'diastolic_bp']
+LIST_FIELDS = ['history', 'lab_issues']
+
+RULES_BY_ANCHOR = {}
+for _index, _r in enumerate(RULES):
+    RULES_BY_ANCHOR.setdefault(_r.anchor, []).append((_index, _r))
+_anchors = sorted(RULES_BY_ANCHOR, key=len, reverse=True)
+ANCHOR_RE = re.compile("|".join(re.escape(a) for a in _anchors))
+# Used when lower-casing changes the text length (rare non-ASCII input)
+ANCHOR_RE_IGNORECASE = re.compile(ANCHOR_RE.pattern, re.IGNORECASE)
+
+LIST_END = re.compile(r"\.|Wait for it", re.IGNORECASE)
+
+# Upper bound on an unterminated list value carried across pages
+MAX_LIST_CHARS = 4000
+
+
+def scan_rules(text):
     """
-    Extracts patient data from a PDF medical report using rule-based regex parsing.
-    
+    Finds the first match of every field in text in one pass.
+
+    Returns:
+        dict: field -> (rule, match) for the earliest-starting match of each
+        field; rules listed first win ties, like alternation in a regex.
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        anchor_re, haystack = ANCHOR_RE, lowered
+    else:
+        anchor_re, haystack = ANCHOR_RE_IGNORECASE, text
+
+    best = {}
+    pos = 0
+    while True:
+        hit = anchor_re.search(haystack, pos)
+        if not hit:
+            break
+        for index, rule in RULES_BY_ANCHOR[hit.group().lower()]:
+            start = hit.start() - rule.offset
+            if start < 0:
+                continue
+            current = best.get(rule.field)
+            if current is not None and current[0] <= (start, index):
+                continue
+            match = rule.pattern.match(text, start)
+            if match:
+                best[rule.field] = ((start, index), rule, match)
+        # Step one character, not past the anchor, so overlapping labels are still seen
+        pos = hit.start() + 1
+    return {field: (rule, match) for field, (_, rule, match) in best.items()}
+
+
+def _convert(match, type_func):
+    try:
+        return type_func(match.group(1).strip())
+    except:
+        return None
+
+
+def iter_page_texts(source, max_pages=None):
+    """
+    Yields the text of each page lazily, releasing pdfplumber's per-page
+    caches as it goes so memory stays bounded for very long documents.
+
     Args:
-        filepath (str): Path to the PDF file.
-        
+        source: Path to the PDF, a seekable binary file object, or bytes/memoryview.
+        max_pages (int, optional): Stop after this many pages.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    pages = range(1, max_pages + 1) if max_pages else None
+    with pdfplumber.open(source, pages=pages) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text()
+            page.close()
+            # Image-only pages have no text layer
+            yield (text or "") + "\n"
+
+
+class FieldExtractor:
+    """
+    Incremental field extraction over a stream of page texts.
+
+    Each page is scanned together with the tail of the previous page: its
+    last line with text and any blank lines after it. A match starting in
+    that tail may still change with the next page ("Name: " followed by a
+    blank page, then the name), so it is only taken when the next page (or
+    result()) rescans the tail. Results match a search over the whole
+    document: the first match of each field wins. `matched` records which
+    rule produced each field.
+    """
+
+    def __init__(self):
+        self.data = {field: None for field in VALUE_FIELDS}
+        self.matched = {}
+        self._bp_pair = None
+        self._bp_fallback = {}
+        self._lists = {}       # field -> finished value
+        self._pending = {}     # field -> unterminated value so far
+        self._carry = ""
+
+    @property
+    def complete(self):
+        """True once no later page can change the result."""
+        return (all(field in self.matched for field in VALUE_FIELDS)
+                and self._bp_pair is not None
+                and len(self._lists) == len(LIST_FIELDS))
+
+    def feed(self, page_text):
+        window = self._carry + page_text
+        # Keep the last line with text, and the blank lines after it, for
+        # matches that straddle the page break
+        tail = window.rstrip().rfind("\n") + 1
+        self._carry = window[tail:]
+
+        # Lists still open from an earlier page just continue
+        for field in list(self._pending):
+            self._close_list(field, self._pending.pop(field) + page_text)
+
+        self._scan(window, tail)
+
+    def _scan(self, window, tail):
+        """Records the matches in window that start before offset tail."""
+        for field, (rule, match) in scan_rules(window).items():
+            if match.start() >= tail:
+                continue
+            if rule.kind == 'value':
+                if field in BP_FALLBACK_FIELDS:
+                    if field not in self._bp_fallback:
+                        self._bp_fallback[field] = (rule, _convert(match, rule.convert))
+                elif field not in self.matched:
+                    self.matched[field] = rule.name
+                    self.data[field] = _convert(match, rule.convert)
+            elif rule.kind == 'pair':
+                if self._bp_pair is None:
+                    self._bp_pair = (rule, int(match.group(1)), int(match.group(2)))
+            elif field not in self.matched:
+                self.matched[field] = rule.name
+                self._close_list(field, window[match.end():])
+
+    def _close_list(self, field, tail):
+        end = LIST_END.search(tail)
+        if end:
+            self._lists[field] = tail[:end.start()]
+        else:
+            self._pending[field] = tail[:MAX_LIST_CHARS]
+
+    def result(self):
+        # The document ends here: the held-back tail is final
+        if self._carry:
+            self._scan(self._carry, len(self._carry))
+            self._carry = ""
+        data = dict(self.data)
+        if self._bp_pair is not None:
+            rule, data['systolic_bp'], data['diastolic_bp'] = self._bp_pair
+            self.matched['systolic_bp'] = self.matched['diastolic_bp'] = rule.name
+        else:
+            for field in BP_FALLBACK_FIELDS:
+                rule, data[field] = self._bp_fallback.get(field, (None, None))
+                if rule:
+                    self.matched[field] = rule.name
+
+        # A list still open at the end of the document runs to the end
+        raw_lists = dict(self._pending, **self._lists)
+        for field in LIST_FIELDS:
+            if field in raw_lists:
+                data[field] = [item.strip() for item in raw_lists[field].split(',') if item.strip()]
+        return data
+
+
+def extract_fields(source, max_pages=None):
+    """
+    Runs the rule table over a PDF.
+
     Returns:
-        dict: Extracted data compatible with the add_patient form.
+        tuple: (data, matched) - the extracted fields and, for each field
+        found, the name of the rule in RULES that matched it. data is {}
+        when the PDF cannot be read.
     """
-    text = ""
+    extractor = FieldExtractor()
+    pages = iter_page_texts(source, max_pages)
     try:
-        with pdfplumber.open(filepath) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
+        for page_text in pages:
+            extractor.feed(page_text)
+            if extractor.complete:
+                break
     except Exception as e:
         print(f"Error reading PDF: {e}")
-        return {}
-
-    data = {}
-    
-    # Helper for regex extraction
-    def extract(pattern, type_func=str):
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            try:
-                val = match.group(1).strip()
-                return type_func(val)
-            except:
-                return None
-        return None
+        return {}, {}
+    finally:
+        # Closes the PDF even when we stop early
+        pages.close()
 
-    # Extraction Rules
-    data['name'] = extract(r"(?:Patient )?Name[:\s]+([a-zA-Z ]+)(?:[\(\n,]|$)")
-    data['age'] = extract(r"(?:Age[:\s]+|\(Age[:\s]+)(\d+)", int)
-    
-    # Gender
-    data['gender'] = extract(r"Gender[:\s]+(Male|Female|Other)")
-    
-    # HR: Heart Rate or HR
-    data['heart_rate'] = extract(r"(?:Heart Rate|HR)[:\s]+(\d+)", int)
-    
-    # BP: Systolic BP or BP xxx/yyy
-    bp_match = re.search(r"(?:BP|Blood Pressure)[:\s]+(\d+)/(\d+)", text, re.IGNORECASE)
-    if bp_match:
-        data['systolic_bp'] = int(bp_match.group(1))
-        data['diastolic_bp'] = int(bp_match.group(2))
-    else:
-        data['systolic_bp'] = extract(r"(?:Systolic BP|SBP)[:\s]+(\d+)", int)
-        data['diastolic_bp'] = extract(r"(?:Diastolic BP|DBP)[:\s]+(\d+)", int)
-    
-    # SpO2
-    data['spo2'] = extract(r"(?:SpO2|Saturation)[:\s]+(\d+)", int)
-    
-    # Temperature: Temp or Temperature, handle "C" 
-    data['temperature'] = extract(r"(?:Temperature|Temp)[:\s]+([\d\.]+)", float)
-    
-    # Respiratory Rate: Respiratory Rate or Resp
-    data['respiratory_rate'] = extract(r"(?:Respiratory Rate|Resp)[:\s]+(\d+)", int)
-    
-    # History
-    # Capture text after "History:" until next keyword or end of sentence/line
-    history_match = re.search(r"(?:Medical History|Clinical History|History)[:\s]+(.*?)(?:\n\.|Wait for it|$)", text, re.IGNORECASE | re.DOTALL)
-    if history_match:
-        raw_hist = history_match.group(1).split('.')[0]
-        data['history'] = [h.strip() for h in raw_hist.split(',') if h.strip()]
-        
-    # Lab
-    lab_match = re.search(r"(?:Lab Results|Lab Indicators|Labs)[:\s]+(.*?)(?:\n\.|Wait for it|$)", text, re.IGNORECASE | re.DOTALL)
-    if lab_match:
-        raw_lab = lab_match.group(1).split('.')[0]
-        data['lab_issues'] = [l.strip() for l in raw_lab.split(',') if l.strip()]
+    data = extractor.result()
+    return data, extractor.matched
+
+
+def extract_data_from_pdf(source, max_pages=None):
+    """
+    Extracts patient data from a PDF medical report using rule-based regex parsing.
+
+    Pages are read one at a time and stop being read once every field is found.
+
+    Args:
+        source: Path to the PDF file, a seekable binary file object (e.g. an
+            upload stream) or the document as bytes/memoryview.
+        max_pages (int, optional): Maximum number of pages to read.
 
+    Returns:
+        dict: Extracted data compatible with the add_patient form.
+    """
+    data, _ = extract_fields(source, max_pages)
     return data
@@ -0,0 +1,129 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from models import db, Patient, RiskLabelStat, DailyRiskStat, DataVersion
+
+RISK_LABELS = ('HIGH', 'MEDIUM', 'LOW')
+TREND_DAYS = 7
+
+
+def _bump(model, delta, **key):
+    """Adds delta to the counter row identified by key, creating it if needed."""
+    updated = model.query.filter_by(**key).update(
+        {model.count: model.count + delta}, synchronize_session=False)
+    if not updated:
+        db.session.add(model(count=delta, **key))
+
+
+def record_admission(admitted_at, label, count=1):
+    """
+    Counts newly admitted patients (count > 1 for batched imports). Runs inside
+    the caller's transaction, so it must be called before the caller commits.
+    """
+    _bump(RiskLabelStat, count, risk_label=label)
+    _bump(DailyRiskStat, count, day=admitted_at.date(), risk_label=label)
+
+
+def record_label_change(admitted_at, old_label, new_label):
+    """Moves a patient between label counters when its risk label changes."""
+    if old_label == new_label:
+        return
+    day = admitted_at.date()
+    _bump(RiskLabelStat, -1, risk_label=old_label)
+    _bump(DailyRiskStat, -1, day=day, risk_label=old_label)
+    _bump(RiskLabelStat, 1, risk_label=new_label)
+    _bump(DailyRiskStat, 1, day=day, risk_label=new_label)
+
+
+def bump_data_version():
+    """
+    Marks the patient data as changed, which invalidates every cached page.
+    Runs inside the caller's transaction, like the counters above.
+    """
+    _bump(DataVersion, 1, name='patients')
+
+
+def data_version():
+    """Current value of the counter bumped by bump_data_version()."""
+    return db.session.query(DataVersion.count).filter_by(name='patients').scalar() or 0
+
+
+def record_label_changes(changes):
+    """
+    Batched record_label_change() for many patients (background re-scoring):
+    changes is an iterable of (admitted_at, old_label, new_label); each
+    counter row is updated once with the net delta.
+    """
+    label_deltas = Counter()
+    day_deltas = Counter()
+    for admitted_at, old_label, new_label in changes:
+        if old_label == new_label:
+            continue
+        day = admitted_at.date()
+        label_deltas[old_label] -= 1
+        label_deltas[new_label] += 1
+        day_deltas[(day, old_label)] -= 1
+        day_deltas[(day, new_label)] += 1
+    for label, delta in label_deltas.items():
+        if delta:
+            _bump(RiskLabelStat, delta, risk_label=label)
+    for (day, label), delta in day_deltas.items():
+        if delta:
+            _bump(DailyRiskStat, delta, day=day, risk_label=label)
+
+
+def rebuild_stats():
+    """
+    Recomputes every counter from the Patient table (backfills, repairs).
+
+    Returns:
+        int: Number of patients counted.
+    """
+    RiskLabelStat.query.delete()
+    DailyRiskStat.query.delete()
+
+    total = 0
+    label_rows = db.session.query(Patient.risk_label, db.func.count(Patient.id)) \
+        .group_by(Patient.risk_label).all()
+    for label, count in label_rows:
+        total += count
+        db.session.add(RiskLabelStat(risk_label=label, count=count))
+
+    admission_day = db.func.date(Patient.admission_date)
+    day_rows = db.session.query(admission_day, Patient.risk_label, db.func.count(Patient.id)) \
+        .group_by(admission_day, Patient.risk_label).all()
+    for day, label, count in day_rows:
+        day = datetime.strptime(str(day), '%Y-%m-%d').date()
+        db.session.add(DailyRiskStat(day=day, risk_label=label, count=count))
+
+    bump_data_version()
+    db.session.commit()
+    return total
+
+
+def dashboard_stats(today=None):
+    """
+    Reads the dashboard figures from the counter tables.
+
+    Returns:
+        dict: total_patients, risk_counts, trend_dates, trend_data
+    """
+    today = today or datetime.utcnow().date()
+    days = [today - timedelta(days=i) for i in range(TREND_DAYS - 1, -1, -1)]
+
+    risk_counts = {label: 0 for label in RISK_LABELS}
+    total_patients = 0
+    for row in RiskLabelStat.query.all():
+        total_patients += row.count
+        if row.risk_label in risk_counts:
+            risk_counts[row.risk_label] = row.count
+
+    trend_rows = DailyRiskStat.query.filter(
+        DailyRiskStat.risk_label == 'HIGH', DailyRiskStat.day >= days[0]).all()
+    per_day = {row.day: row.count for row in trend_rows}
+
+    return {
+        'total_patients': total_patients,
+        'risk_counts': risk_counts,
+        'trend_dates': [day.strftime('%Y-%m-%d') for day in days],
+        'trend_data': [per_day.get(day, 0) for day in days],
+    }
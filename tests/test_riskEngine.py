@@ -1,10 +1,190 @@
 import unittest
+import json
+import random
 import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from risk_engine import calculate_risk
+from risk_engine import RULES, calculate_risk, calculate_risk_batch, classify_condition, classify_lab, compile_rules
+
+
+def reference_calculate_risk(data):
+    """The hand-coded rules as they were before risk_rules.json (fuzz oracle)."""
+    score = 0
+    notes = []
+    critical_triggers = []
+
+    age = data.get('age', 0)
+    hr = data.get('heart_rate', 0)
+    bp = data.get('systolic_bp', 0)
+    spo2 = data.get('spo2', 100)
+    temp = data.get('temperature', 37.0)
+    resp = data.get('respiratory_rate', 18)
+    history = data.get('history', [])
+    er_visits = data.get('er_visits', 0)
+    lab_issues = data.get('lab_issues', [])
+
+    # CRITICAL ESCALATION PROTOCOL
+
+    if spo2 < 85:
+        critical_triggers.append(f"Critical: SpO2 {spo2}% (<85%)")
+
+    if bp < 80:
+        critical_triggers.append(f"Critical: Systolic BP {bp} (<80 mmHg)")
+
+    if hr > 140:
+        critical_triggers.append(f"Critical: Heart Rate {hr} (>140 bpm)")
+
+    # STANDARD SCORING ENGINE
+
+    if 60 <= age <= 75:
+        score += 1
+        notes.append("Age 60-75")
+    elif age > 75:
+        score += 2
+        notes.append("Age >75")
+
+
+    if 100 <= hr <= 120:
+        score += 1
+        notes.append("HR 100-120")
+    elif hr > 120:
+        score += 2
+        notes.append("HR >120")
+
+
+    if bp < 90:
+        score += 2
+        notes.append("Systolic BP <90")
+
+
+    if 90 <= spo2 <= 93:
+        score += 1
+        notes.append("SpO2 90-93%")
+    elif spo2 < 90:
+        score += 2
+        notes.append("SpO2 <90%")
+
+
+    if 38 <= temp <= 39:
+        score += 1
+        notes.append("Temp 38-39°C")
+    elif temp > 39:
+        score += 2
+        notes.append("Temp >39°C")
+
+    if resp > 24:
+        score += 1
+        notes.append("Resp Rate >24")
+
+    # Clinical History
+    valid_conditions = [
+        "Diabetes", "COPD", "Cardiac Disease", "Cardiac",
+        "Hypertension", "High Blood Pressure",
+        "Stroke", "CVA",
+        "Kidney Disease", "Renal Failure",
+        "Cancer", "Malignancy",
+        "Asthma",
+        "Heart Failure", "CHF",
+        "Pneumonia"
+    ]
+    condition_count = 0
+    unrecognized_conditions = []
+
+    for cond in history:
+        if not cond or not cond.strip():
+            continue
+        matched = False
+        for valid in valid_conditions:
+            if valid.lower() in cond.lower():
+                condition_count += 1
+                score += 1
+                notes.append(f"History: {cond}")
+                matched = True
+                break
+
+        if not matched:
+            unrecognized_conditions.append(cond)
+            notes.append(f"WARNING: Unrecognized condition '{cond}'")
+
+    if 2 <= er_visits <= 3:
+        score += 1
+        notes.append("ER Visits 2-3")
+    elif er_visits > 3:
+        score += 2
+        notes.append("ER Visits >3")
+
+    # Lab Indicators
+    valid_labs = ["Elevated WBC", "High Creatinine", "High CRP"]
+
+    for lab in lab_issues:
+        if not lab or not lab.strip():
+            continue
+
+        matched = False
+        for valid in valid_labs:
+            if valid.lower() in lab.lower():
+                score += 1
+                notes.append(f"Lab: {lab}")
+                matched = True
+                break
+
+        if not matched:
+            notes.append(f"WARNING: Unrecognized lab '{lab}'")
+
+    # FINAL CLASSIFICATION
+
+    label = "LOW"
+
+    if critical_triggers:
+        label = "HIGH"
+        notes.insert(0, " CRITICAL ESCALATION TRIGGERED ")
+        notes.extend(critical_triggers)
+    else:
+        if score >= 6:
+            label = "HIGH"
+        elif score >= 3:
+            label = "MEDIUM"
+        else:
+            label = "LOW"
+
+    return {
+        "score": score,
+        "label": label,
+        "notes": notes,
+        "unrecognized_conditions": unrecognized_conditions
+    }
+
+
+# Band edges for random_patient(), with ints, floats and values in between
+FUZZ_EDGES = {
+    'age': [0, 59, 60, 60.5, 75, 75.5, 76, 99],
+    'heart_rate': [0, 99, 100, 120, 120.5, 121, 140, 140.5, 141, 200],
+    'systolic_bp': [0, 79, 79.9, 80, 89, 89.9, 90, 180],
+    'spo2': [70, 84, 84.9, 85, 89, 89.5, 90, 93, 93.5, 94, 100],
+    'temperature': [35.0, 37.9, 38, 38.0, 39, 39.0, 39.05, 41.2],
+    'respiratory_rate': [8, 24, 24.5, 25, 40],
+    'er_visits': [0, 1, 2, 3, 3.5, 4, 9],
+}
+FUZZ_ENTRIES = ['Diabetes', 'copd', ' Chronic Kidney Disease ', 'cardiac disease', 'Cardiac arrest',
+                'Unknown Ailment', 'Elevated WBC', 'very high crp', 'Low Sodium', '', '   ', None]
+
+
+def random_patient(rng):
+    """A fuzz input concentrated on band edges, with some fields missing."""
+    data = {}
+    for field, values in FUZZ_EDGES.items():
+        roll = rng.random()
+        if roll < 0.1:
+            continue  # exercise the defaults
+        data[field] = rng.choice(values) if roll < 0.6 else round(rng.uniform(values[0], values[-1]), 1)
+    if rng.random() < 0.9:
+        data['history'] = rng.sample(FUZZ_ENTRIES, rng.randint(0, 4))
+    if rng.random() < 0.9:
+        data['lab_issues'] = rng.sample(FUZZ_ENTRIES, rng.randint(0, 3))
+    return data
+
 
 class TestRiskEngine(unittest.TestCase):
 
@@ -82,5 +262,93 @@ class TestRiskEngine(unittest.TestCase):
         self.assertIn("History: Stroke", result['notes'])
         self.assertIn("History: Asthma", result['notes'])
 
+    def test_classifier_first_match_wins(self):
+        # Vocabulary order decides, not position in the text
+        self.assertEqual(classify_condition('Pneumonia, Diabetes'), 'Diabetes')
+        self.assertEqual(classify_condition('  cardiac disease (stable) '), 'Cardiac Disease')
+        self.assertEqual(classify_lab('Very HIGH CRP'), 'High CRP')
+        self.assertIsNone(classify_condition('Migraine'))
+        self.assertIsNone(classify_lab('Low Sodium'))
+
+    def test_batch_matches_scalar(self):
+        rng = random.Random(42)
+        conditions = ['Diabetes', 'copd', 'Chronic Kidney Disease', 'Unknown Ailment', '', '  ']
+        labs = ['Elevated WBC', 'high crp', 'Low Sodium', '']
+        records = []
+        for _ in range(2000):
+            data = {
+                'age': rng.randint(0, 100),
+                'heart_rate': rng.randint(30, 180),
+                'systolic_bp': rng.randint(60, 200),
+                'spo2': rng.randint(70, 100),
+                'temperature': round(rng.uniform(35.0, 41.0), 1),
+                'respiratory_rate': rng.randint(8, 40),
+                'er_visits': rng.randint(0, 6),
+                'history': rng.sample(conditions, rng.randint(0, 3)),
+                'lab_issues': rng.sample(labs, rng.randint(0, 2)),
+            }
+            # Exercise the defaults for missing fields too
+            for key in ('temperature', 'respiratory_rate', 'er_visits', 'lab_issues'):
+                if rng.random() < 0.1:
+                    del data[key]
+            records.append(data)
+
+        batch = calculate_risk_batch(records)
+
+        for i, data in enumerate(records):
+            expected = calculate_risk(data)
+            self.assertEqual(int(batch['score'][i]), expected['score'])
+            self.assertEqual(str(batch['label'][i]), expected['label'])
+            self.assertEqual(bool(batch['critical'][i]),
+                             "CRITICAL ESCALATION" in ' '.join(expected['notes']))
+
+    def test_batch_columnar_input(self):
+        columns = {
+            'age': [72, 30],
+            'heart_rate': [102, 70],
+            'systolic_bp': [110, 120],
+            'spo2': [91, 84],
+            'temperature': [36.8, 37.0],
+            'history': [['Diabetes', 'COPD'], []],
+            'er_visits': [1, 0],
+            'lab_issues': [['Elevated WBC'], []],
+        }
+        result = calculate_risk_batch(columns)
+        self.assertEqual(result['score'].tolist(), [6, 2])
+        self.assertEqual(result['label'].tolist(), ['HIGH', 'HIGH'])
+        self.assertEqual(result['critical'].tolist(), [False, True])
+
+    def test_compiled_rules_match_reference(self):
+        rng = random.Random(2024)
+        for _ in range(20000):
+            data = random_patient(rng)
+            self.assertEqual(calculate_risk(data), reference_calculate_risk(data), data)
+
+    def test_explain_false_matches(self):
+        rng = random.Random(7)
+        for _ in range(5000):
+            data = random_patient(rng)
+            full = calculate_risk(data)
+            fast = calculate_risk(data, explain=False)
+            self.assertEqual(fast, {
+                'score': full['score'],
+                'label': full['label'],
+                'critical': "CRITICAL ESCALATION" in ' '.join(full['notes'])
+            }, data)
+
+    def test_rule_table_compiler(self):
+        rules = json.loads(json.dumps(RULES))
+        # A band without a note still scores
+        rules['scoring'][0]['bands'][1].pop('note')
+        scorer = compile_rules(rules)
+        result = scorer({'age': 80, 'heart_rate': 70, 'systolic_bp': 120})
+        self.assertEqual(result['score'], 2)
+        self.assertNotIn('Age >75', result['notes'])
+
+        broken = json.loads(json.dumps(RULES))
+        broken['scoring'][0]['bands'][0] = {'points': 1}
+        with self.assertRaises(ValueError):
+            compile_rules(broken)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
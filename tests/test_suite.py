@@ -1,16 +1,19 @@
 import unittest
+import io
 import json
 import os
 import shutil
 import sys
+import time
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 os.environ['DATABASE_URI'] = 'sqlite:///:memory:'
 
-from app import app, db, Patient
+from app import app, db, Patient, AuditLog, response_cache
+from stats import rebuild_stats, dashboard_stats
 from risk_engine import calculate_risk
-from service_pdf import extract_data_from_pdf
+from service_pdf import FieldExtractor, extract_data_from_pdf, extract_fields, scan_rules
 from reportlab.pdfgen import canvas
 
 class TestRiskEngine(unittest.TestCase):
@@ -97,6 +100,65 @@ class TestPDFParsing(unittest.TestCase):
         if os.path.exists(self.test_pdf):
             os.remove(self.test_pdf)
 
+    def test_async_upload_job(self):
+        import time
+        app.config['TESTING'] = True
+        client = app.test_client()
+        with open(self.test_pdf, 'rb') as f:
+            response = client.post('/upload_pdf?async=1', data={'file': (f, 'report.pdf')})
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.data)['job_id']
+
+        deadline = time.time() + 30
+        while True:
+            status = json.loads(client.get(f'/upload_pdf/jobs/{job_id}').data)
+            if status['status'] not in ('pending', 'running') or time.time() > deadline:
+                break
+            time.sleep(0.1)
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['result']['name'], "John Test")
+        self.assertEqual(client.get('/upload_pdf/jobs/unknown').status_code, 404)
+
+        from pdf_jobs import PDFJobQueue
+        with app.app_context():
+            # Job state is in the database: another server process can answer the poll
+            self.assertEqual(PDFJobQueue().job_status(job_id)['result']['name'], "John Test")
+            # The finished job stored its result in the extraction cache once
+            self.assertEqual(json.loads(client.get('/upload_pdf/cache').data)['entries'], 1)
+
+    def test_extract_from_memory(self):
+        import io
+        with open(self.test_pdf, 'rb') as f:
+            raw = f.read()
+        for source in (raw, memoryview(raw), io.BytesIO(raw)):
+            data = extract_data_from_pdf(source)
+            self.assertEqual(data.get('name'), "John Test")
+            self.assertEqual(data.get('diastolic_bp'), 80)
+
+    def test_upload_spills_when_large(self):
+        app.config['TESTING'] = True
+        client = app.test_client()
+        original = app.config['PDF_SPOOL_MAX_MEMORY']
+        app.config['PDF_SPOOL_MAX_MEMORY'] = 16
+        spill_pdf = "test_spill.pdf"
+        c = canvas.Canvas(spill_pdf)
+        c.drawString(100, 750, "Patient Name: Spill Test")
+        c.drawString(100, 730, "Age: 61")
+        c.save()
+        try:
+            with open(spill_pdf, 'rb') as f:
+                response = client.post('/upload_pdf', data={'file': (f, 'big.pdf')})
+        finally:
+            app.config['PDF_SPOOL_MAX_MEMORY'] = original
+            os.remove(spill_pdf)
+        self.assertEqual(json.loads(response.data).get('age'), 61)
+
+    def test_job_queue_depth_limit(self):
+        from pdf_jobs import PDFJobQueue, QueueFullError
+        queue = PDFJobQueue(max_queue=0)
+        with self.assertRaises(QueueFullError):
+            queue.submit(self.test_pdf)
+
     def test_extract_data(self):
         data = extract_data_from_pdf(self.test_pdf)
         self.assertEqual(data.get('name'), "John Test")
@@ -107,10 +169,235 @@ class TestPDFParsing(unittest.TestCase):
         self.assertIn('Diabetes', data.get('history', []))
 
 
+class TestBulkIngest(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.dir = tempfile.mkdtemp()
+        for name, lines in [
+            ('a.pdf', ["Patient Name: Ann Bulk", "Age: 81", "Heart Rate: 125 bpm", "BP: 85/50 mmHg",
+                       "SpO2: 96%", "Temp: 37.2 C", "Resp: 18"]),
+            ('nested/b.pdf', ["Patient Name: Ben Bulk", "Age: 30", "Heart Rate: 72 bpm", "BP: 118/76 mmHg",
+                              "SpO2: 97%", "Temp: 36.8 C", "Resp: 16"]),
+            ('no_vitals.pdf', ["Patient Name: Cal Bulk", "Age: 50", "Heart Rate: 80 bpm", "SpO2: 98%"]),
+            ('broken.pdf', ["Nothing useful here"]),
+        ]:
+            path = os.path.join(self.dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            c = canvas.Canvas(path)
+            for i, line in enumerate(lines):
+                c.drawString(100, 750 - 20 * i, line)
+            c.save()
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_ingest_and_resume(self):
+        from ingest_pdfs import ingest
+        with app.app_context():
+            summary = ingest(self.dir, workers=2, batch_size=1)
+            self.assertEqual((summary['ingested'], summary['failed']), (2, 2))
+            self.assertEqual(Patient.query.count(), 2)
+            self.assertEqual(AuditLog.query.filter_by(field_changed="Creation").count(), 2)
+            self.assertEqual(Patient.query.filter_by(name="Ann Bulk").one().risk_label, 'HIGH')
+            self.assertEqual(Patient.query.filter_by(name="Ben Bulk").one().risk_label, 'LOW')
+            self.assertEqual(dashboard_stats()['total_patients'], 2)
+
+            with open(os.path.join(self.dir, 'ingest_errors.csv')) as f:
+                report = f.read()
+            self.assertIn('broken.pdf,"Missing required field(s): name, age, heart_rate', report)
+            # Unrecorded vitals are not scored as 0 (critical)
+            self.assertIn('no_vitals.pdf,"Missing required field(s): systolic_bp, temperature, respiratory_rate"',
+                          report)
+
+            # A second run skips the files already ingested and retries the failed ones
+            summary = ingest(self.dir, workers=2)
+            self.assertEqual((summary['ingested'], summary['failed'], summary['skipped']), (0, 2, 2))
+            self.assertEqual(Patient.query.count(), 2)
+
+    def test_ingest_retries_failed_inserts(self):
+        from unittest import mock
+        import ingest_pdfs
+        with app.app_context():
+            with mock.patch.object(ingest_pdfs, 'insert_batch', side_effect=RuntimeError("disk full")):
+                summary = ingest_pdfs.ingest(self.dir, workers=2)
+            self.assertEqual((summary['ingested'], summary['failed']), (0, 4))
+            with open(os.path.join(self.dir, 'ingest_errors.csv')) as f:
+                self.assertIn('a.pdf,Insert failed: disk full', f.read())
+
+            summary = ingest_pdfs.ingest(self.dir, workers=2)
+            self.assertEqual((summary['ingested'], summary['skipped']), (2, 0))
+            self.assertEqual(Patient.query.count(), 2)
+
+
+class TestMigrations(unittest.TestCase):
+    def test_upgrade_schema_adds_missing_indexes(self):
+        from sqlalchemy import create_engine, inspect
+        from migrations import upgrade_schema
+
+        engine = create_engine('sqlite:///:memory:')
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for index in Patient.__table__.indexes:
+                index.drop(conn)
+            conn.exec_driver_sql("ALTER TABLE patient DROP COLUMN rule_version")
+
+        created = upgrade_schema(engine)
+        self.assertIn('patient.rule_version', created)
+        self.assertIn('ix_patient_risk_admission', created)
+        self.assertIn('ix_patient_admission', created)
+        names = {ix['name'] for ix in inspect(engine).get_indexes('patient')}
+        self.assertIn('ix_patient_risk_admission', names)
+        # Second run is a no-op and only reads the schema
+        from sqlalchemy import event
+        statements = []
+        event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        self.assertEqual(upgrade_schema(engine), [])
+        self.assertFalse([sql for sql in statements if sql.lstrip().upper().startswith(('CREATE', 'ALTER'))])
+
+    def test_backfill_admission_dates(self):
+        from datetime import datetime
+        from sqlalchemy import create_engine
+        from migrations import backfill_admission_dates
+
+        engine = create_engine('sqlite:///:memory:')
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            # A legacy table, from before admission_date was required
+            conn.exec_driver_sql("DROP TABLE patient")
+            conn.exec_driver_sql("CREATE TABLE patient (id INTEGER PRIMARY KEY, name VARCHAR, admission_date DATETIME)")
+            conn.exec_driver_sql("INSERT INTO patient (id, name) VALUES (1, 'Audited'), (2, 'Bare')")
+            conn.exec_driver_sql("INSERT INTO patient VALUES (3, 'Dated', '2024-03-01 09:00:00.000000')")
+            conn.exec_driver_sql("INSERT INTO audit_log (patient_id, timestamp, field_changed) "
+                                 "VALUES (1, '2024-01-02 08:30:00.000000', 'Creation')")
+
+        self.assertEqual(backfill_admission_dates(engine), 2)
+        with engine.connect() as conn:
+            dates = dict(conn.exec_driver_sql("SELECT name, admission_date FROM patient").all())
+        self.assertEqual(dates['Audited'], '2024-01-02 08:30:00.000000')
+        self.assertEqual(dates['Dated'], '2024-03-01 09:00:00.000000')
+        self.assertIsNotNone(dates['Bare'])
+        self.assertEqual(backfill_admission_dates(engine), 0)
+
+    def test_name_prefix_search_uses_index(self):
+        from sqlalchemy import create_engine, inspect
+        from migrations import upgrade_schema
+
+        engine = create_engine('sqlite:///:memory:')
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            # A database from before the NOCASE index
+            conn.exec_driver_sql("DROP INDEX ix_patient_name_nocase")
+            conn.exec_driver_sql("CREATE INDEX ix_patient_name ON patient (name)")
+        self.assertEqual(sorted(upgrade_schema(engine)), ['-ix_patient_name', 'ix_patient_name_nocase'])
+        self.assertNotIn('ix_patient_name', {ix['name'] for ix in inspect(engine).get_indexes('patient')})
+
+        query = db.select(Patient).where(Patient.name.like('ann%', escape='\\'))
+        with engine.connect() as conn:
+            sql = str(query.compile(engine, compile_kwargs={'literal_binds': True}))
+            plan = ' '.join(str(row) for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql))
+        self.assertIn('ix_patient_name_nocase', plan)
+
+
+class TestAppFactory(unittest.TestCase):
+    def test_create_app(self):
+        import tempfile
+        from app import create_app, engine_options
+        with tempfile.TemporaryDirectory() as tmp:
+            uri = f"sqlite:///{os.path.join(tmp, 'factory.db')}"
+            other = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'PATIENTS_PER_PAGE': 7,
+                                'RESCORE_ON_STARTUP': False})
+            self.assertIsNot(other, app)
+            self.assertEqual(other.config['PATIENTS_PER_PAGE'], 7)
+            self.assertEqual(other.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'], other.config['DB_POOL_SIZE'])
+            self.assertEqual(other.test_client().get('/').status_code, 200)
+            with other.app_context():
+                self.assertEqual(db.engine.url.database, os.path.join(tmp, 'factory.db'))
+                db.engine.dispose()
+
+        config = {'SQLALCHEMY_DATABASE_URI': 'postgresql://risk@db/risk', 'DB_POOL_SIZE': 8,
+                  'DB_MAX_OVERFLOW': 4, 'DB_POOL_RECYCLE': 600}
+        self.assertEqual(engine_options(config), {'pool_size': 8, 'max_overflow': 4,
+                                                  'pool_recycle': 600, 'pool_pre_ping': True})
+        self.assertEqual(engine_options(dict(config, SQLALCHEMY_DATABASE_URI='sqlite:///:memory:')), {})
+
+
+class TestStreamingExtraction(unittest.TestCase):
+    def setUp(self):
+        self.test_pdf = "test_pages.pdf"
+        c = canvas.Canvas(self.test_pdf)
+        c.drawString(100, 750, "Patient Name: Page Test")
+        c.drawString(100, 730, "Age: 70")
+        c.drawString(100, 710, "Heart Rate:")
+        c.showPage()
+        c.showPage()  # blank page with no text layer
+        c.drawString(100, 750, "95 bpm")
+        c.drawString(100, 730, "History: Diabetes,")
+        c.showPage()
+        c.drawString(100, 750, "COPD. Labs: High CRP.")
+        c.showPage()
+        c.save()
+
+    def tearDown(self):
+        if os.path.exists(self.test_pdf):
+            os.remove(self.test_pdf)
+
+    def test_fields_across_pages(self):
+        data = extract_data_from_pdf(self.test_pdf)
+        self.assertEqual(data['name'], "Page Test")
+        self.assertEqual(data['heart_rate'], 95)
+        self.assertEqual(data['history'], ['Diabetes', 'COPD'])
+        self.assertEqual(data['lab_issues'], ['High CRP'])
+
+    def test_max_pages(self):
+        data = extract_data_from_pdf(self.test_pdf, max_pages=1)
+        self.assertEqual(data['age'], 70)
+        self.assertIsNone(data['heart_rate'])
+        self.assertNotIn('history', data)
+
+    def test_extract_fields_reports_rules(self):
+        data, matched = extract_fields(self.test_pdf)
+        self.assertEqual(data['age'], 70)
+        self.assertEqual(matched['name'], 'patient_name')
+        self.assertEqual(matched['heart_rate'], 'heart_rate')
+        self.assertEqual(matched['lab_issues'], 'labs')
+        self.assertNotIn('spo2', matched)
+
+    def test_scan_rules_prefers_bp_pair(self):
+        found = scan_rules("Systolic BP: 130\nBP: 85/50 mmHg")
+        self.assertEqual(found['blood_pressure'][0].name, 'bp')
+        self.assertEqual(found['systolic_bp'][0].name, 'systolic_bp')
+        extractor = FieldExtractor()
+        extractor.feed("Systolic BP: 130\nBP: 85/50 mmHg\n")
+        result = extractor.result()
+        self.assertEqual((result['systolic_bp'], result['diastolic_bp']), (85, 50))
+
+
+    def test_streaming_matches_whole_document(self):
+        documents = [
+            # Label at the end of a page, value after a whitespace-only page
+            ["Referral\nPatient Name:\n", "   \n", "John Smith\nAge: 40\n"],
+            # Label line with a trailing space, value on the next page
+            ["Referral\nName: \n", "Jane Doe\nHR: 88\n"],
+        ]
+        for pages in documents:
+            whole = scan_rules(''.join(pages))
+            extractor = FieldExtractor()
+            for page in pages:
+                extractor.feed(page)
+            result = extractor.result()
+            self.assertEqual(result['name'], whole['name'][1].group(1).strip())
+            self.assertEqual(extractor.matched['name'], whole['name'][0].name)
+
 class TestWebApp(unittest.TestCase):
     def setUp(self):
         app.config['TESTING'] = True
         self.app = app.test_client()
+        response_cache.clear()
         
         with app.app_context():
             db.create_all()
@@ -124,6 +411,284 @@ class TestWebApp(unittest.TestCase):
         response = self.app.get('/')
         self.assertEqual(response.status_code, 200)
 
+    def test_dashboard_aggregates(self):
+        from datetime import datetime, timedelta
+        now = datetime.utcnow()
+        with app.app_context():
+            for label, admitted in [('HIGH', now), ('HIGH', now), ('HIGH', now - timedelta(days=2)),
+                                    ('HIGH', now - timedelta(days=30)), ('MEDIUM', now), ('LOW', now)]:
+                db.session.add(Patient(name="Agg Test", age=40, risk_label=label, admission_date=admitted))
+            db.session.commit()
+            self.assertEqual(rebuild_stats(), 6)
+
+        response = self.app.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'[4, 1, 1]', response.data)
+        self.assertIn(b'[0, 0, 0, 0, 1, 0, 2]', response.data)
+
+    def test_stats_follow_writes(self):
+        form = {
+            'name': 'Stats User', 'age': '50', 'gender': 'Male', 'heart_rate': '80',
+            'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '99', 'temperature': '37.0',
+            'respiratory_rate': '18', 'er_visits': '0', 'history': '', 'lab_issues': '', 'notes': ''
+        }
+        self.app.post('/add', data=form)
+        self.app.post('/add', data=form)
+        update = dict(form, heart_rate='150')
+        self.app.post('/update/1', data=update)
+
+        with app.app_context():
+            incremental = dashboard_stats()
+            self.assertEqual(incremental['risk_counts'], {'HIGH': 1, 'MEDIUM': 0, 'LOW': 1})
+            self.assertEqual(incremental['trend_data'][-1], 1)
+            rebuild_stats()
+            self.assertEqual(dashboard_stats(), incremental)
+
+    def test_patient_list_keyset_pagination(self):
+        from datetime import datetime
+        app.config['PATIENTS_PER_PAGE'] = 2
+        same_time = datetime(2025, 1, 10, 9, 0)
+        with app.app_context():
+            # Three patients share an admission timestamp so the id tie-breaker matters
+            for i, admitted in enumerate([datetime(2025, 1, 12), same_time, same_time, same_time, datetime(2025, 1, 1)]):
+                db.session.add(Patient(name=f"Page{i}", age=40, risk_label='LOW', admission_date=admitted))
+            db.session.commit()
+
+        seen = []
+        url = '/patients'
+        try:
+            while url:
+                response = self.app.get(url)
+                self.assertEqual(response.status_code, 200)
+                body = response.data.decode()
+                names = [f"Page{i}" for i in range(5) if f">Page{i}<" in body]
+                seen += sorted(names, key=lambda n: body.index(f">{n}<"))
+                marker = 'href="/patients?cursor='
+                url = None
+                if marker in body:
+                    start = body.index(marker) + len('href="')
+                    url = body[start:body.index('"', start)].replace('&amp;', '&')
+        finally:
+            app.config['PATIENTS_PER_PAGE'] = 50
+        self.assertEqual(seen, ['Page0', 'Page3', 'Page2', 'Page1', 'Page4'])
+
+    def test_patient_list_filters(self):
+        from datetime import datetime
+        with app.app_context():
+            db.session.add(Patient(name="Alice High", age=40, risk_label='HIGH', admission_date=datetime(2025, 3, 5)))
+            db.session.add(Patient(name="Alan Low", age=40, risk_label='LOW', admission_date=datetime(2025, 3, 5)))
+            db.session.add(Patient(name="Bob High", age=40, risk_label='HIGH', admission_date=datetime(2025, 2, 1)))
+            db.session.commit()
+
+        body = self.app.get('/patients?risk=HIGH').data
+        self.assertIn(b'Alice High', body)
+        self.assertIn(b'Bob High', body)
+        self.assertNotIn(b'Alan Low', body)
+
+        body = self.app.get('/patients?q=Al&from=2025-03-01&to=2025-03-05').data
+        self.assertIn(b'Alice High', body)
+        self.assertIn(b'Alan Low', body)
+        self.assertNotIn(b'Bob High', body)
+
+        body = self.app.get('/patients?q=%25').data
+        self.assertIn(b'No patients match', body)
+
+    def test_cohort_filters(self):
+        from cohorts import rebuild_cohorts
+        with app.app_context():
+            db.session.add(Patient(name="Cohort Copd", age=40, risk_label='HIGH',
+                                   history=json.dumps(["COPD exacerbation", "Diabetes"])))
+            db.session.add(Patient(name="Cohort Diabetic", age=40, risk_label='LOW',
+                                   history=json.dumps(["diabetes"]), lab_issues=json.dumps(["High CRP"])))
+            db.session.add(Patient(name="Cohort Gout", age=40, risk_label='LOW', history=json.dumps(["Gout"])))
+            db.session.commit()
+            # Rows written directly are picked up by a rebuild
+            self.assertEqual(rebuild_cohorts(), 3)
+
+        self.app.post('/add', data={
+            'name': 'Cohort Form', 'age': '40', 'gender': 'Male',
+            'heart_rate': '80', 'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '99',
+            'temperature': '37.0', 'respiratory_rate': '18', 'er_visits': '0',
+            'history': 'COPD', 'lab_issues': '', 'notes': ''
+        })
+
+        body = self.app.get('/patients?condition=copd').data
+        self.assertIn(b'Cohort Copd', body)
+        self.assertIn(b'Cohort Form', body)
+        self.assertNotIn(b'Cohort Diabetic', body)
+
+        body = self.app.get('/patients?condition=Diabetes&lab=High+CRP').data
+        self.assertIn(b'Cohort Diabetic', body)
+        self.assertNotIn(b'Cohort Copd', body)
+
+        # Unrecognised entries still match on their exact text
+        body = self.app.get('/patients?condition=gout').data
+        self.assertIn(b'Cohort Gout', body)
+        self.assertNotIn(b'Cohort Copd', body)
+
+        counts = json.loads(self.app.get('/api/cohorts').data)
+        self.assertEqual(counts['conditions']['COPD'], {'HIGH': 1, 'LOW': 1})
+        self.assertEqual(counts['labs']['High CRP'], {'LOW': 1})
+
+    def test_json_columns_parsed_once(self):
+        from unittest import mock
+        import models
+        p = Patient(name="Memo", age=40, history=json.dumps(["Diabetes", " "]), lab_issues="[]")
+        with mock.patch.object(models.json, 'loads', wraps=json.loads) as loads:
+            self.assertEqual(p.history_list, ["Diabetes"])
+            p.to_dict()
+            self.assertEqual(loads.call_count, 2)  # history + lab_issues, once each
+            p.history = json.dumps(["COPD"])
+            self.assertEqual(p.history_list, ["COPD"])
+            self.assertEqual(loads.call_count, 3)
+
+    def test_audit_timeline_paging(self):
+        from datetime import datetime, timedelta
+        app.config['AUDIT_LOGS_PER_PAGE'] = 3
+        base = datetime(2025, 5, 1, 8, 0)
+        with app.app_context():
+            p = Patient(name="Timeline Test", age=60, risk_label='LOW')
+            db.session.add(p)
+            db.session.flush()
+            for i in range(7):
+                db.session.add(AuditLog(patient_id=p.id, timestamp=base + timedelta(minutes=i),
+                                        field_changed='heart_rate', old_value=str(i), new_value=str(i + 1),
+                                        risk_change='No Change'))
+            db.session.commit()
+            p_id = p.id
+
+        try:
+            response = self.app.get(f'/patient/{p_id}')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'Load older', response.data)
+            self.assertIn(b'08:06:00', response.data)
+            self.assertNotIn(b'08:03:00', response.data)
+
+            cursor = response.data.decode().split('data-cursor="')[1].split('"')[0]
+            collected = []
+            while cursor:
+                page = json.loads(self.app.get(f'/patient/{p_id}/logs', query_string={'before': cursor}).data)
+                collected += [log['new_value'] for log in page['logs']]
+                cursor = page['next_cursor']
+        finally:
+            app.config['AUDIT_LOGS_PER_PAGE'] = 20
+        self.assertEqual(collected, ['4', '3', '2', '1'])
+
+    def test_pdf_upload_cache(self):
+        from app import pdf_cache
+        pdf_path = "test_cache.pdf"
+        c = canvas.Canvas(pdf_path)
+        c.drawString(100, 750, "Patient Name: Cache Test")
+        c.drawString(100, 730, "Age: 33")
+        c.save()
+        try:
+            hits, misses = pdf_cache.hits, pdf_cache.misses
+            for _ in range(2):
+                with open(pdf_path, 'rb') as f:
+                    response = self.app.post('/upload_pdf', data={'file': (f, 'cache.pdf')})
+                self.assertEqual(json.loads(response.data)['name'], "Cache Test")
+            self.assertEqual((pdf_cache.hits - hits, pdf_cache.misses - misses), (1, 1))
+
+            # Async uploads of a cached file complete without a job
+            with open(pdf_path, 'rb') as f:
+                response = self.app.post('/upload_pdf?async=1', data={'file': (f, 'cache.pdf')})
+            body = json.loads(response.data)
+            self.assertEqual(body['status'], 'done')
+            self.assertEqual(body['result']['age'], 33)
+
+            stats = json.loads(self.app.get('/upload_pdf/cache').data)
+            self.assertEqual(stats['entries'], 1)
+        finally:
+            os.remove(pdf_path)
+
+    def test_pdf_cache_eviction(self):
+        from pdf_cache import PDFCache
+        with app.app_context():
+            cache = PDFCache(max_entries=2, max_age=3600)
+            for key in ('a', 'b', 'c'):
+                cache.put(key, {'name': key})
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(cache.get('c'), {'name': 'c'})
+
+            expired = PDFCache(max_entries=2, max_age=-1)
+            self.assertIsNone(expired.get('c'))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            # A recently used entry is served without taking the write lock
+            from sqlalchemy import event
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                self.assertEqual(cache.get('b'), {'name': 'b'})
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertFalse([sql for sql in statements if sql.lstrip().upper().startswith('UPDATE')])
+
+    def test_bulk_import_export(self):
+        app.config['BULK_CHUNK_SIZE'] = 2
+        try:
+            body = ("name,age,heart_rate,systolic_bp,spo2,temperature,respiratory_rate,history,admission_date\n"
+                    "Bulk One,80,130,85,88,38.2,24,\"Diabetes, COPD\",2024-01-02T08:00:00\n"
+                    "Bulk Two,,70,120,98,37.0,16,,\n"
+                    "Bulk Three,30,70,120,98,37.0,16,,\n"
+                    "Bulk Four,45,72,118,97,36.9,15,Asthma,\n"
+                    "Bulk Five,50,80,,98,37.0,,,\n")
+            response = self.app.post('/api/patients/import', data=body, content_type='text/csv')
+            summary = json.loads(response.data)
+            self.assertEqual((summary['imported'], summary['failed']), (3, 2))
+            self.assertEqual(summary['errors'], [
+                {'line': 3, 'error': 'Missing required field: age'},
+                # Not scored as BP 0 (critical)
+                {'line': 6, 'error': 'Missing required field(s): systolic_bp, respiratory_rate'}])
+        finally:
+            app.config['BULK_CHUNK_SIZE'] = 1000
+
+        with app.app_context():
+            first = Patient.query.filter_by(name="Bulk One").first()
+            self.assertEqual(first.risk_label, calculate_risk(first.to_dict())['label'])
+            self.assertEqual(first.history_list, ['Diabetes', 'COPD'])
+            self.assertEqual(first.logs.count(), 1)
+            self.assertEqual(dashboard_stats()['total_patients'], 3)
+
+        response = self.app.get('/api/patients/export?format=ndjson')
+        records = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual([r['name'] for r in records], ["Bulk One", "Bulk Three", "Bulk Four"])
+        self.assertEqual(records[0]['admission_date'], "2024-01-02T08:00:00")
+
+        # A CSV export imports back unchanged (apart from new ids)
+        exported = self.app.get('/api/patients/export').data
+        response = self.app.post('/api/patients/import',
+                                 data={'file': (io.BytesIO(exported), 'patients.csv')})
+        self.assertEqual(json.loads(response.data)['imported'], 3)
+        with app.app_context():
+            copies = Patient.query.filter_by(name="Bulk One").all()
+            self.assertEqual(len(copies), 2)
+            self.assertEqual(copies[0].history_list, copies[1].history_list)
+
+    def test_bulk_import_field_types(self):
+        vitals = {'age': 40, 'heart_rate': 80, 'systolic_bp': 120, 'spo2': 98,
+                  'temperature': 37.0, 'respiratory_rate': 16}
+        lines = [dict(vitals, name=12345), dict(vitals, name={'first': 'A'}), dict(vitals, name="Typed", notes=7),
+                 dict(vitals, name="Typed", history=5), dict(vitals, name="Typed", age={'years': 40}),
+                 dict(vitals, name="Typed", age=71.9), dict(vitals, name="Typed", heart_rate=True),
+                 dict(vitals, name="Typed", history=["COPD"]), dict(vitals, name="Whole", age=72.0)]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n'
+        response = self.app.post('/api/patients/import?format=ndjson', data=body)
+        self.assertEqual(response.status_code, 200)
+        summary = json.loads(response.data)
+        self.assertEqual((summary['imported'], summary['failed']), (2, 7))
+        self.assertEqual([e['error'] for e in summary['errors']], [
+            "Invalid name: 12345", "Invalid name: {'first': 'A'}", "Invalid notes: 7",
+            "Invalid history: 5", "Invalid age: {'years': 40}", "Invalid age: 71.9", "Invalid heart_rate: True"])
+
+    def test_bulk_import_caps_errors(self):
+        from bulk_patients import import_patients
+        with app.app_context():
+            summary = import_patients(io.StringIO("name,age\n" + "Bad,x\n" * 50), max_errors=10)
+        self.assertEqual(summary['failed'], 50)
+        self.assertEqual([line for line, _ in summary['errors']], list(range(2, 12)))
+
     def test_add_patient(self):
         response = self.app.post('/add', data={
             'name': 'Test User',
@@ -186,6 +751,423 @@ class TestWebApp(unittest.TestCase):
             self.assertEqual(p.risk_label, 'HIGH')
             self.assertEqual(p.notes, 'New Note')
 
+    def test_update_patient_missing_vitals(self):
+        from risk_engine import RULESET_VERSION
+        with app.app_context():
+            # e.g. a referral ingested before vitals were required
+            p = Patient(name="No Vitals", age=50, heart_rate=80, spo2=98, er_visits=0, notes="",
+                        risk_label='LOW', risk_score=0, rule_version=RULESET_VERSION)
+            db.session.add(p)
+            db.session.commit()
+            p_id = p.id
+
+        body = self.app.get(f'/patient/{p_id}').data
+        self.assertNotIn(b'value="None"', body)
+        self.assertIn(b'name="systolic_bp" value=""', body)
+
+        # The browser submits the empty inputs as ""
+        form = {'heart_rate': '80', 'systolic_bp': '', 'diastolic_bp': '', 'spo2': '98',
+                'temperature': '', 'respiratory_rate': '', 'er_visits': '0', 'notes': 'Seen'}
+        self.assertEqual(self.app.post(f'/update/{p_id}', data=form).status_code, 302)
+
+        # A scoring change is refused until the missing vitals are entered
+        response = self.app.post(f'/update/{p_id}', data=dict(form, heart_rate='130'), follow_redirects=True)
+        self.assertIn(b'Enter Systolic BP, Temperature, Respiratory Rate to recalculate the risk.', response.data)
+        with app.app_context():
+            p = Patient.query.get(p_id)
+            self.assertEqual((p.notes, p.heart_rate, p.systolic_bp, p.risk_label), ('Seen', 80, None, 'LOW'))
+
+        self.app.post(f'/update/{p_id}', data=dict(form, heart_rate='130', systolic_bp='120',
+                                                   temperature='37.0', respiratory_rate='18'))
+        with app.app_context():
+            self.assertEqual(Patient.query.get(p_id).heart_rate, 130)
+
+    def test_update_patient_logs_rule_version_change(self):
+        from risk_engine import RULESET_VERSION
+        with app.app_context():
+            # Labelled HIGH under an older ruleset; scores LOW now
+            p = Patient(name="Stale Save", age=30, heart_rate=70, systolic_bp=120, diastolic_bp=80, spo2=98,
+                        temperature=37.0, respiratory_rate=16, er_visits=0, notes="",
+                        history=json.dumps([]), lab_issues=json.dumps([]),
+                        risk_label='HIGH', risk_score=6, rule_version=None)
+            db.session.add(p)
+            db.session.commit()
+            p_id = p.id
+
+        # Saved with no field edits
+        form = {'heart_rate': '70', 'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '98',
+                'temperature': '37.0', 'respiratory_rate': '16', 'er_visits': '0', 'notes': ''}
+        self.app.post(f'/update/{p_id}', data=form)
+        with app.app_context():
+            p = db.session.get(Patient, p_id)
+            self.assertEqual((p.risk_label, p.rule_version), ('LOW', RULESET_VERSION))
+            logs = AuditLog.query.filter_by(patient_id=p_id).all()
+            self.assertEqual([(l.field_changed, l.old_value, l.new_value, l.risk_change) for l in logs],
+                             [('Rule Version', 'v0', f"v{RULESET_VERSION}", 'HIGH -> LOW')])
+
+    def test_rescore_stale_patients(self):
+        from rescore import rescore_stale, stale_count
+        from cohorts import rebuild_cohorts, cohort_counts
+        from models import PatientCondition
+        from risk_engine import RULESET_VERSION
+        with app.app_context():
+            # Stored labels from an older ruleset, one of them now wrong
+            db.session.add(Patient(name="Stale High", age=30, heart_rate=70, systolic_bp=120, spo2=98,
+                                   temperature=37.0, respiratory_rate=16, risk_label='HIGH', rule_version=None,
+                                   history=json.dumps(["COPD"])))
+            db.session.add(Patient(name="Stale Low", age=80, heart_rate=150, systolic_bp=120, spo2=98,
+                                   temperature=37.0, respiratory_rate=16, risk_label='HIGH', rule_version=0))
+            # Missing vitals: not re-scored with the engine's defaults (BP 0 = critical)
+            db.session.add(Patient(name="Partial", age=50, risk_label='LOW', rule_version=None,
+                                   history=json.dumps(["COPD"])))
+            # Already on the current version (e.g. edited meanwhile): left alone
+            db.session.add(Patient(name="Current", age=30, heart_rate=70, systolic_bp=120, spo2=98,
+                                   temperature=37.0, respiratory_rate=16, risk_label='MEDIUM',
+                                   rule_version=RULESET_VERSION))
+            db.session.commit()
+            rebuild_stats()
+            rebuild_cohorts()
+            # Entries classified under an older vocabulary that did not know the term
+            PatientCondition.query.update({'term': None})
+            db.session.commit()
+            self.assertEqual(stale_count(), 2)
+
+            progress = rescore_stale(chunk_size=2, pause=0)
+            self.assertEqual(progress, {'rescored': 2, 'label_changes': 1})
+            self.assertEqual(stale_count(), 0)
+
+            labels = {p.name: p.risk_label for p in Patient.query.all()}
+            self.assertEqual(labels, {'Stale High': 'LOW', 'Stale Low': 'HIGH',
+                                      'Partial': 'LOW', 'Current': 'MEDIUM'})
+            logs = AuditLog.query.filter_by(field_changed='Rule Version').all()
+            self.assertEqual(sorted(log.risk_change for log in logs), ['HIGH -> LOW'])
+            # Counters were moved in batch, matching a full recount
+            self.assertEqual(dashboard_stats()['risk_counts'], {'HIGH': 1, 'MEDIUM': 1, 'LOW': 2})
+            # Conditions were re-classified under the current vocabularies
+            self.assertEqual([c.term for c in PatientCondition.query.all()], ['COPD', 'COPD'])
+            self.assertEqual(cohort_counts()['conditions']['COPD'], {'LOW': 2})
+
+            # Nothing is left to do on a second run
+            self.assertEqual(rescore_stale(pause=0)['rescored'], 0)
+
+        status = json.loads(self.app.get('/api/rescore').data)
+        self.assertEqual(status['stale'], 0)
+
+    def test_writes_commit_once(self):
+        from sqlalchemy import event
+        commits = []
+        listener = lambda session: commits.append(session)
+        event.listen(db.session, 'after_commit', listener)
+        try:
+            self.app.post('/add', data={
+                'name': 'Single Commit', 'age': '40', 'gender': 'Female',
+                'heart_rate': '80', 'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '99',
+                'temperature': '37.0', 'respiratory_rate': '18', 'er_visits': '0', 'notes': ''
+            })
+            self.assertEqual(len(commits), 1)
+            with app.app_context():
+                p = Patient.query.filter_by(name='Single Commit').first()
+                self.assertEqual(p.logs.count(), 1)
+                # Flag the stored score so a re-score would be visible
+                p.risk_score = 99
+                db.session.commit()
+                p_id = p.id
+
+            # Only the notes change: no scoring input changed, so no re-score
+            commits.clear()
+            self.app.post(f'/update/{p_id}', data={
+                'heart_rate': '80', 'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '99',
+                'temperature': '37.0', 'respiratory_rate': '18', 'er_visits': '0', 'notes': 'Seen'
+            })
+            self.assertEqual(len(commits), 1)
+            with app.app_context():
+                p = Patient.query.get(p_id)
+                self.assertEqual((p.notes, p.risk_score), ('Seen', 99))
+        finally:
+            event.remove(db.session, 'after_commit', listener)
+
+    def test_sqlite_wal_mode(self):
+        import tempfile
+        from sqlalchemy import create_engine, text
+        from models import configure_sqlite
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'wal.db')}")
+            configure_sqlite(engine, 2500)
+            with engine.connect() as conn:
+                self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar(), 'wal')
+                self.assertEqual(conn.execute(text("PRAGMA busy_timeout")).scalar(), 2500)
+            engine.dispose()
+
+    def test_instrumentation(self):
+        from app import instrumentation
+        # Off by default: no header, no metrics
+        self.assertNotIn('Server-Timing', self.app.get('/').headers)
+        self.assertEqual(self.app.get('/metrics').status_code, 404)
+
+        instrumentation.enable()
+        try:
+            response = self.app.post('/add', data={
+                'name': 'Timed Patient', 'age': '70', 'gender': 'Male',
+                'heart_rate': '110', 'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '95',
+                'temperature': '37.0', 'respiratory_rate': '18', 'er_visits': '0', 'notes': ''
+            })
+            self.assertIn('risk;dur=', response.headers['Server-Timing'])
+            self.assertIn('db;dur=', response.headers['Server-Timing'])
+
+            timing = self.app.get('/').headers['Server-Timing']
+            self.assertIn('template;dur=', timing)
+            self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+            self.assertIn('total;dur=', timing)
+
+            metrics = self.app.get('/metrics')
+            self.assertEqual(metrics.status_code, 200)
+            text = metrics.get_data(as_text=True)
+            self.assertIn('http_requests_total{endpoint="main.dashboard",method="GET",status="200"} 1', text)
+            self.assertIn('http_request_duration_seconds_count{endpoint="main.add_patient",method="POST"} 1', text)
+            self.assertIn('http_request_phase_duration_seconds_bucket{endpoint="main.dashboard",phase="template",le="+Inf"} 1', text)
+            self.assertIn('http_request_db_queries_total{endpoint="main.dashboard"}', text)
+        finally:
+            instrumentation.disable()
+        self.assertNotIn('Server-Timing', self.app.get('/').headers)
+
+    def test_query_budget_per_page(self):
+        from app import query_log
+        for i in range(12):
+            self.app.post('/add', data={
+                'name': f'Budget {i}', 'age': '70', 'gender': 'Male',
+                'heart_rate': '110', 'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '95',
+                'temperature': '37.0', 'respiratory_rate': '18', 'er_visits': '0', 'notes': '',
+                'history': 'COPD, Diabetes', 'lab_issues': 'High CRP'
+            })
+        with app.app_context():
+            p_id = Patient.query.first().id
+
+        # Page -> most SQL statements it may run, however many patients are listed
+        # (cached pages include the read of the data version, the dashboard the live feed's start id)
+        budgets = {'main.dashboard': ('/', 5), 'main.patient_list': ('/patients', 3),
+                   'main.patient_details': (f'/patient/{p_id}', 3), 'main.cohorts_summary': ('/api/cohorts', 2)}
+        query_log.reset()
+        query_log.enable()
+        try:
+            with self.assertNoLogs(app.logger, 'WARNING'):
+                for url, _ in budgets.values():
+                    self.assertEqual(self.app.get(url).status_code, 200)
+            summary = json.loads(self.app.get('/api/queries').data)
+        finally:
+            query_log.disable()
+        for endpoint, (url, budget) in budgets.items():
+            self.assertLessEqual(summary[endpoint]['max'], budget, f"{url} ran {summary[endpoint]['max']} queries")
+        self.assertEqual(self.app.get('/api/queries').status_code, 404)
+
+    def test_slow_query_and_n_plus_one_log(self):
+        from query_log import QueryLog, query_shape
+        self.assertEqual(query_shape("SELECT * FROM patient WHERE id IN (?, ?, ?) AND age > 60"),
+                         query_shape("SELECT * FROM patient WHERE id IN (?, ?)  AND age > 75"))
+
+        with app.app_context():
+            db.session.add_all([Patient(name=f'N{i}', age=50, risk_label='LOW') for i in range(3)])
+            db.session.commit()
+            ids = [p_id for (p_id,) in db.session.query(Patient.id)]
+
+            log = QueryLog(slow_ms=0, repeat_threshold=3)
+            log.logger = app.logger
+            log.enable()
+            try:
+                with self.assertLogs(app.logger, 'WARNING') as captured:
+                    db.session.execute(db.text("SELECT name FROM patient WHERE id = :id"), {'id': ids[0]})
+                self.assertIn('Slow query', captured.output[0])
+                self.assertIn(str(ids[0]), captured.output[0])
+
+                # A failing statement leaves nothing behind on the pooled connection
+                with self.assertRaises(Exception):
+                    db.session.execute(db.text("SELECT * FROM no_such_table"))
+                db.session.rollback()
+                self.assertFalse([key for key in db.session.connection().info if key.startswith('query_log')])
+
+                # One lookup per patient, as a lazy relationship in a loop would do
+                with app.test_request_context('/'):
+                    log._start_request()
+                    for p_id in ids:
+                        db.session.execute(db.text(f"SELECT name FROM patient WHERE id = {p_id}"))
+                    with self.assertLogs(app.logger, 'WARNING') as captured:
+                        log._finish_request(app.response_class())
+                    log._end_request(None)
+            finally:
+                log.disable()
+            self.assertIn('Possible N+1', captured.output[-1])
+            self.assertEqual(log.summary()['main.dashboard']['max'], 3)
+
+    def test_page_cache_and_etag(self):
+        form = {'heart_rate': '80', 'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '99',
+                'temperature': '37.0', 'respiratory_rate': '18', 'er_visits': '0'}
+        self.app.post('/add', data=dict(form, name='Cached Patient', age='40', gender='Female', notes=''))
+        with app.app_context():
+            p_id = Patient.query.filter_by(name='Cached Patient').first().id
+
+        first = self.app.get('/patients')
+        etag = first.headers['ETag']
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+        hits = response_cache.hits
+        second = self.app.get('/patients')
+        self.assertEqual(response_cache.hits, hits + 1)
+        self.assertEqual((second.data, second.headers['ETag']), (first.data, etag))
+
+        # Conditional GET of an unchanged page
+        not_modified = self.app.get('/patients', headers={'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b'')
+
+        # A write invalidates the cached page straight away
+        self.app.post(f'/update/{p_id}', data=dict(form, heart_rate='130'))
+        changed = self.app.get('/patients', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+        self.assertIn(b'130', self.app.get(f'/patient/{p_id}').data)
+
+        # Bounded LRU and TTL
+        from response_cache import ResponseCache, CacheEntry
+        cache = ResponseCache(max_entries=2, ttl=60)
+        for key in ('a', 'b', 'c'):
+            cache.get(key, 1)
+            cache.put(key, 1, CacheEntry(b'', 'text/html', key, time.monotonic()))
+        self.assertIsNone(cache.get('a', 1))
+        self.assertIsNotNone(cache.get('c', 1))
+        cache.put('d', 1, CacheEntry(b'', 'text/html', 'd', time.monotonic() - 61))
+        self.assertIsNone(cache.get('d', 1))
+        self.assertIsNone(cache.get('c', 2))
+
+    def test_live_feed(self):
+        from unittest import mock
+        from live_feed import LiveFeed
+        # Events are loaded by poll() here instead of the watcher thread
+        feed = LiveFeed(poll_interval=0)
+        with mock.patch('app.live_feed', feed):
+            response = self.app.get('/api/live')
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            stream = response.iter_encoded()
+            read = lambda: next(stream).decode()
+            self.assertIn('retry:', read())
+
+            form = {'heart_rate': '80', 'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '99',
+                    'temperature': '37.0', 'respiratory_rate': '18', 'er_visits': '0'}
+            self.app.post('/add', data=dict(form, name='Live Patient', age='40', gender='Female', notes=''))
+            with app.app_context():
+                feed.poll()
+            chunk = read()
+            self.assertIn('event: admission', chunk)
+            admitted = json.loads(chunk.split('data: ', 1)[1])
+            self.assertEqual((admitted['patient']['name'], admitted['patient']['risk_label']), ('Live Patient', 'LOW'))
+
+            self.app.post(f"/update/{admitted['patient']['id']}", data=dict(form, heart_rate='150'))
+            with app.app_context():
+                feed.poll()
+            chunk = read()
+            self.assertIn('event: update', chunk)
+            update = json.loads(chunk.split('data: ', 1)[1])
+            self.assertEqual((update['old_label'], update['risk_label']), ('LOW', 'HIGH'))
+            self.assertGreater(update['version'], admitted['version'])
+            self.assertEqual(feed.subscribers, 1)
+            response.close()
+            self.assertEqual(feed.subscribers, 0)
+
+    def test_live_feed_resumes_from_rendered_page(self):
+        from unittest import mock
+        from live_feed import LiveFeed
+        feed = LiveFeed(poll_interval=0)
+        form = {'heart_rate': '80', 'systolic_bp': '120', 'diastolic_bp': '80', 'spo2': '99',
+                'temperature': '37.0', 'respiratory_rate': '18', 'er_visits': '0', 'gender': 'Male', 'notes': ''}
+        with mock.patch('app.live_feed', feed):
+            self.app.post('/add', data=dict(form, name='Before Render', age='40'))
+            page = self.app.get('/').data.decode()
+            self.assertIn('/api/live?after=1', page)
+            # Saved after the page was rendered, before its feed connected
+            self.app.post('/add', data=dict(form, name='Before Connect', age='41'))
+            response = self.app.get('/api/live?after=1')
+            stream = response.iter_encoded()
+            next(stream)
+            chunk = next(stream).decode()
+            response.close()
+        self.assertIn('id: 2\nevent: admission', chunk)
+        self.assertIn('Before Connect', chunk)
+
+    def test_live_feed_replay_and_refresh(self):
+        from live_feed import LiveFeed
+        from bulk_patients import import_patients
+        from stats import bump_data_version, data_version
+
+        def publish(feed, n):
+            bump_data_version()
+            feed.publish('admission', {'n': n}, data_version())
+            db.session.commit()
+
+        with app.app_context():
+            feed = LiveFeed(history=2, heartbeat=0.01, poll_interval=0)
+            feed.poll()
+            stream = feed.stream()
+            self.assertIn('retry:', next(stream))
+            self.assertEqual(next(stream), ": keep-alive\n\n")
+            publish(feed, 1)
+            feed.poll()
+            self.assertIn('id: 1\nevent: admission', next(stream))
+            stream.close()
+
+            # Event ids come from the database, so another process can replay them
+            publish(feed, 2)
+            other = LiveFeed(history=2, heartbeat=0.01, poll_interval=0)
+            other.poll()
+            replay = other.stream(last_id=1)
+            next(replay)
+            self.assertIn('id: 2\n', next(replay))
+            replay.close()
+
+            # A client further behind than the buffer reloads
+            for n in (3, 4):
+                publish(feed, n)
+            other.poll()
+            lagging = other.stream(last_id=1)
+            next(lagging)
+            self.assertIn('event: refresh', next(lagging))
+            lagging.close()
+
+            # Writes that published nothing are picked up from the data version
+            waiting = other.stream()
+            next(waiting)
+            import_patients(io.StringIO("name,age,heart_rate,systolic_bp,spo2,temperature,respiratory_rate\n"
+                                        "Bulk Live,50,80,120,98,37.0,16\n"))
+            other.poll()
+            self.assertIn('id: 4\nevent: refresh', next(waiting))
+            waiting.close()
+
+    def test_live_feed_max_streams(self):
+        from live_feed import LiveFeed
+        feed = LiveFeed(max_streams=1, busy_retry=30, poll_interval=0)
+        feed._last_id = 0
+        first = feed.stream()
+        next(first)
+        # Turned away with a longer retry instead of holding another server thread
+        self.assertEqual(list(feed.stream()), ["retry: 30000\n\n"])
+        self.assertEqual(feed.subscribers, 1)
+        first.close()
+        self.assertEqual(feed.subscribers, 0)
+
+    def test_live_feed_starts_one_watcher(self):
+        import threading
+        from live_feed import LiveFeed
+        feed = LiveFeed(poll_interval=3600)
+        watchers = lambda: sum(1 for t in threading.enumerate() if t.name == 'live-feed')
+        before = watchers()
+        # As from concurrent first /api/live requests
+        gate = threading.Barrier(8)
+        def subscribe():
+            gate.wait()
+            feed.start(app)
+        threads = [threading.Thread(target=subscribe) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(watchers() - before, 1)
+
 
 if __name__ == '__main__':
     unittest.main()
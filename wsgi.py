@@ -0,0 +1,12 @@
+"""
+Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Each worker process builds its own application (and connection pool) with
+the factory; settings come from the environment, see gunicorn.conf.py for
+the worker model.
+"""
+from app import create_app
+
+application = create_app()